@@ -1,65 +1,312 @@
-import io
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+import os
+import hashlib
+import argparse
+import asyncio
+import time
+from typing import Literal
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import uvicorn
-from src.utils import get_prop_list,get_planarea_list, get_filtered_table, get_stats, get_chart_pricediff, get_chart_anngrowth, get_performers
+from src.utils import assemble_report, performers_payload, render_histogram, timed_stage, CHART_STYLES, STAGE_OBSERVERS
+from src.store import DatasetStore, publish_columnar
+from src.cache import ResultCache, normalize_query, MISSING
+from src.charts import ChartRenderer
+from src.cube import GRIDS, chart_bins
+from src.export import EXPORT_FORMATS, decode_cursor, encode_cursor, page, select_columns, stream_rows, pa
+from src.metrics import Metrics
+from src.profiling import RequestProfile, profiling, profile_requested, profile_tag
+from src.workers import WorkerPool, Overloaded, lists_task, stats_task, performers_task, positions_task, histogram_task
 
-app = FastAPI()
+store = DatasetStore()
+cache = ResultCache(
+    max_entries=int(os.environ.get("PROPALANTIR_CACHE_ENTRIES", 256)),
+    max_bytes=int(os.environ.get("PROPALANTIR_CACHE_MB", 64)) * 2**20,
+    ttl=float(os.environ.get("PROPALANTIR_CACHE_TTL", 3600)),
+)
+stats_mode = os.environ.get("PROPALANTIR_STATS_MODE", "auto")
+exact_stats_max_rows = int(os.environ.get("PROPALANTIR_EXACT_STATS_MAX_ROWS", 20000))
+workers = WorkerPool(
+    max_workers=int(os.environ.get("PROPALANTIR_WORKERS", 4)),
+    max_pending=int(os.environ.get("PROPALANTIR_MAX_PENDING", 64)),
+    processes=os.environ.get("PROPALANTIR_WORKER_MODE", "thread") == "process",
+)
+http_max_age = int(os.environ.get("PROPALANTIR_HTTP_MAX_AGE", 300))
+profile_dir = os.environ.get("PROPALANTIR_PROFILE_DIR")
+profile_lock = asyncio.Lock()
+metrics = Metrics()
+STAGE_OBSERVERS.append(metrics.observe_stage)
+renderer = ChartRenderer(max_entries=int(os.environ.get("PROPALANTIR_CHART_CACHE_ENTRIES", 512)), executor=workers)
+
+@asynccontextmanager
+async def lifespan(app):
+    store.load()
+    workers.start(store)
+    yield
+    workers.shutdown()
+
+app = FastAPI(lifespan=lifespan)
+# Brotli when the optional brotli-asgi package is installed; it falls back to gzip for clients without br
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1000, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1000, compresslevel=6)
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    '''Latency, status and in-flight count per route; unknown paths share one label'''
+    path = request.url.path
+    endpoint = path if path in {route.path for route in app.routes} else "other"
+    metrics.in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.in_flight.inc(amount=-1)
+        metrics.observe_request(endpoint, status, time.perf_counter() - start)
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    '''With PROPALANTIR_PROFILE_DIR set, profiles requests sent with X-Profile: 1 or ?profile=1, one at a time'''
+    if profile_dir is None or not profile_requested(request.headers, request.query_params) or profile_lock.locked():
+        return await call_next(request)
+    async with profile_lock:
+        profile = RequestProfile(profile_dir, request.url.path, profile_tag(request.query_params, normalize_query))
+        with profile:
+            response = await call_next(request)
+        response.headers["X-Profile-Id"] = profile.name
+        return response
+
+@app.exception_handler(Overloaded)
+async def overloaded(request, exc):
+    return JSONResponse({"detail": "Server busy, retry shortly"}, status_code=503, headers={"Retry-After": "1"})
+
+async def cached_task(query, field, task, *args):
+    '''Result of task(version, query, *args) run on the worker pool, served from the cache when possible'''
+    version = store.current().version
+    if profile := profiling.get():
+        # Skips the cache and the pool so the profiler sees the work itself, on a thread so the loop stays free
+        return await asyncio.to_thread(profile.run, task, version, query, *args)
+    value = cache.get(version, query, field)
+    if value is MISSING:
+        value = await workers.run(task, version, query, *args)
+        cache.put(version, query, field, value)
+
+    return value
+
+async def cached_stats(query, mode):
+    return await cached_task(query, "stats_" + mode, stats_task, mode, exact_stats_max_rows)
+
+async def cached_performers(query, n=10):
+    return await cached_task(query, "performers", performers_task, n)
+
+async def cached_histogram(query, name):
+    return await cached_task(query, "hist_" + name, histogram_task, name)
+
+async def cached_chart(query, name):
+    '''PNG of the named histogram cropped to its occupied range, or None when nothing matched'''
+    version = store.current().version
+    if profile := profiling.get():
+        bins = chart_bins(await cached_histogram(query, name), GRIDS[name][1])
+        return None if bins is None else await asyncio.to_thread(profile.run, render_histogram, *bins, CHART_STYLES[name])
+    png = cache.get(version, query, "chart_" + name)
+    if png is MISSING:
+        bins = chart_bins(await cached_histogram(query, name), GRIDS[name][1])
+        png = None if bins is None else await asyncio.wrap_future(renderer.submit(*bins, name))
+        cache.put(version, query, "chart_" + name, png)
+
+    return png
+
+async def cached_lists():
+    version = store.current().version
+    lists = cache.get(version, "lists", "lists")
+    if lists is MISSING:
+        lists = await workers.run(lists_task, version)
+        cache.put(version, "lists", "lists", lists)
+
+    return lists
+
+def query_etag(request, *parts):
+    '''Weak validator for a response: dataset version, route and the normalized parameters. Weak because
+    the compression middleware sends the same content gzip- or brotli-encoded or as is under one tag'''
+    key = repr((store.current().version, request.url.path) + parts)
+    return 'W/"{}"'.format(hashlib.sha1(key.encode()).hexdigest()[:20])
+
+def cache_headers(etag):
+    return {"ETag": etag, "Cache-Control": "public, max-age={}".format(http_max_age)}
+
+def not_modified(request, etag):
+    '''304 response when If-None-Match already holds the current ETag, else None; compared weakly, as
+    RFC 9110 requires for If-None-Match'''
+    tags = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag.removeprefix("W/") in tags or "*" in tags:
+        return Response(status_code=304, headers=cache_headers(etag))
+
+    return None
+
+def png_response(png, etag):
+    if png is None:
+        return JSONResponse(None, headers=cache_headers(etag))
+
+    return Response(png, media_type="image/png", headers=cache_headers(etag))
 
 @app.get('/')
-def read_main():
+async def read_main():
     return {}
 
 @app.get('/propnames')
-def send_prop_list():
-    prop_list = get_prop_list()
-    prop_list.insert(0,"All")
+async def send_prop_list(request: Request, response: Response):
+    etag = query_etag(request)
+    if cached := not_modified(request, etag):
+        return cached
+    prop_list = ["All"] + (await cached_lists())[0]
+    response.headers.update(cache_headers(etag))
     return {"proplists":prop_list}
 
+@app.get('/searchprojects')
+async def send_project_search(request: Request, response: Response, q: str = "", limit: int = Query(10, ge=1, le=100)):
+    '''Project names matching a search box entry, best matches first; prefix and trigram lookups alike are cheap enough to run inline'''
+    etag = query_etag(request, q, limit)
+    if cached := not_modified(request, etag):
+        return cached
+    projects = store.current().search.search(q, limit)
+    response.headers.update(cache_headers(etag))
+    return {"projects":projects}
+
 @app.get('/planningareas')
-def send_planarea_list():
-    planarea_list = get_planarea_list()
+async def send_planarea_list(request: Request, response: Response):
+    etag = query_etag(request)
+    if cached := not_modified(request, etag):
+        return cached
+    planarea_list = (await cached_lists())[1]
+    response.headers.update(cache_headers(etag))
     return {"planlists":planarea_list}
 
 @app.get('/stats')
-def send_stats(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear):
-    df = get_filtered_table(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
-    dict_stats = get_stats(df)
-    return {"stat_dict":dict_stats}
+async def send_stats(request: Request, response: Response, propname,proptype,planarea,propsize_min,propsize_max,newsaleyear,statsmode: Literal["auto", "exact", "approx"] = None):
+    query = normalize_query(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
+    etag = query_etag(request, query, statsmode or stats_mode)
+    if cached := not_modified(request, etag):
+        return cached
+    dict_stats, rank_error = await cached_stats(query, statsmode or stats_mode)
+    response.headers.update(cache_headers(etag))
+    if rank_error is None:
+        return {"stat_dict":dict_stats, "stat_mode":"exact"}
+    else:
+        return {"stat_dict":dict_stats, "stat_mode":"approx", "rank_error":rank_error}
 
 @app.get('/chartprice')
-def send_chartprice(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear):
-    df = get_filtered_table(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
-    if len(df) != 0:
-        chartprice = get_chart_pricediff(df)
-        return StreamingResponse(io.BytesIO(chartprice.read()), media_type="image/png")
-    else:
-        return None
+async def send_chartprice(request: Request, propname,proptype,planarea,propsize_min,propsize_max,newsaleyear):
+    query = normalize_query(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
+    etag = query_etag(request, query)
+    return not_modified(request, etag) or png_response(await cached_chart(query, 'pricediff'), etag)
 
 @app.get('/chartgrowth')
-def send_chartgrowth(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear):
-    df = get_filtered_table(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
-    if len(df) != 0:
-        chartgrowth = get_chart_anngrowth(df)
-        return StreamingResponse(io.BytesIO(chartgrowth.read()), media_type="image/png")
-    else:
-        return None
+async def send_chartgrowth(request: Request, propname,proptype,planarea,propsize_min,propsize_max,newsaleyear):
+    query = normalize_query(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
+    etag = query_etag(request, query)
+    return not_modified(request, etag) or png_response(await cached_chart(query, 'anngrowth'), etag)
 
 @app.get('/performerstop')
-def send_df_performers_top(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear):
-    df = get_filtered_table(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
-    df_top = get_performers(df)
-    dict_top = df_top.head(10).fillna(0).to_dict()
-    
+async def send_df_performers_top(request: Request, response: Response, propname,proptype,planarea,propsize_min,propsize_max,newsaleyear,format: Literal["columns", "records", "arrays"] = "columns"):
+    query = normalize_query(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
+    etag = query_etag(request, query, format)
+    if cached := not_modified(request, etag):
+        return cached
+    df_top, _ = await cached_performers(query)
+    with timed_stage("serialize"):
+        dict_top = performers_payload(df_top, format)
+    response.headers.update(cache_headers(etag))
+
     return {"top_dict":dict_top}
 
 @app.get('/performersbottom')
-def send_df_performers_top(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear):
-    df = get_filtered_table(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
-    df_bottom = get_performers(df)
-    dict_bottom = df_bottom.tail(10).fillna(0).to_dict()
-    
+async def send_df_performers_bottom(request: Request, response: Response, propname,proptype,planarea,propsize_min,propsize_max,newsaleyear,format: Literal["columns", "records", "arrays"] = "columns"):
+    query = normalize_query(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
+    etag = query_etag(request, query, format)
+    if cached := not_modified(request, etag):
+        return cached
+    _, df_bottom = await cached_performers(query)
+    with timed_stage("serialize"):
+        dict_bottom = performers_payload(df_bottom, format)
+    response.headers.update(cache_headers(etag))
+
     return {"bottom_dict":dict_bottom}
 
+@app.get('/report')
+async def send_report(request: Request, response: Response, propname,proptype,planarea,propsize_min,propsize_max,newsaleyear,format: Literal["columns", "records", "arrays"] = "columns"):
+    query = normalize_query(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
+    etag = query_etag(request, query, stats_mode, format)
+    if cached := not_modified(request, etag):
+        return cached
+    (dict_stats, _), chart_price, chart_growth, (df_top, df_bottom) = await asyncio.gather(
+        cached_stats(query, stats_mode),
+        cached_chart(query, 'pricediff'),
+        cached_chart(query, 'anngrowth'),
+        cached_performers(query),
+    )
+    response.headers.update(cache_headers(etag))
+    with timed_stage("serialize"):
+        return assemble_report(dict_stats, chart_price, chart_growth, df_top, df_bottom, format)
+
+@app.get('/histograms')
+async def send_histograms(request: Request, response: Response, propname,proptype,planarea,propsize_min,propsize_max,newsaleyear):
+    query = normalize_query(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
+    etag = query_etag(request, query)
+    if cached := not_modified(request, etag):
+        return cached
+    counts = await asyncio.gather(*[cached_histogram(query, name) for name in GRIDS])
+    response.headers.update(cache_headers(etag))
+    return {name: {"edges": GRIDS[name][1].tolist(), "counts": hist.tolist()} for name, hist in zip(GRIDS, counts)}
+
+@app.get('/transactions')
+async def send_transactions(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear,format: Literal["ndjson", "csv", "arrow"] = "ndjson",
+                            columns: str = None, cursor: str = None, limit: int = Query(None, ge=1)):
+    '''Streams the filtered rows in chunks. With limit, at most that many rows are sent and X-Next-Cursor
+    carries the cursor for the following page; it is absent on the last page'''
+    query = normalize_query(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear)
+    view = store.current()
+    if format == "arrow" and pa is None:
+        return JSONResponse({"detail": "Arrow export requires pyarrow"}, status_code=501)
+    try:
+        selected = select_columns(view.df, columns)
+        after = decode_cursor(cursor, view.version) if cursor else None
+    except ValueError as e:
+        return JSONResponse({"detail": str(e)}, status_code=400)
+    positions, resume = page(await cached_task(query, "positions", positions_task), after, limit)
+    headers = {"Cache-Control": "no-store"}
+    if resume is not None:
+        headers["X-Next-Cursor"] = encode_cursor(view.version, resume)
+
+    return StreamingResponse(stream_rows(view.df, positions, selected, format), media_type=EXPORT_FORMATS[format], headers=headers)
+
+@app.get('/cachestats')
+async def send_cache_stats(response: Response):
+    response.headers["Cache-Control"] = "no-store"
+    return {**cache.stats(), "charts": renderer.stats(), "workers": workers.stats()}
+
+@app.get('/metrics')
+async def send_metrics():
+    cache_stats = cache.stats()
+    gauges = {"cache_" + key: cache_stats[key] for key in ("entries", "bytes", "hits", "misses", "evictions")}
+    gauges.update({"worker_pending": workers.pending, "worker_rejected": workers.rejected})
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4", headers={"Cache-Control": "no-store"})
+
 if __name__ == "__main__":
-    uvicorn.run(app)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Serve the propalantir API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes sharing one mapped dataset")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Every worker maps the same column and structure files, so memory stays flat as workers are added
+        os.environ["PROPALANTIR_DATA_FILE"] = publish_columnar(store.path)
+        uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,137 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+'''
+Filter Result Cache
+'''
+
+MISSING = object()
+
+def normalize_query(propname, proptype, planarea, propsize_min, propsize_max, newsaleyear):
+    '''Canonical filter key; planning areas are de-duplicated and sorted so "A,B" and "B,A" match'''
+    if planarea != "All":
+        planarea = ",".join(sorted(set(planarea.split(","))))
+
+    return (propname, proptype, planarea, int(propsize_min), int(propsize_max), str(newsaleyear))
+
+def estimate_bytes(value):
+    '''Rough in-memory size of a cached value'''
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_bytes(k) + estimate_bytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_bytes(v) for v in value)
+
+    return sys.getsizeof(value)
+
+class CacheEntry:
+    def __init__(self, created):
+        self.created = created
+        self.fields = {}
+        self.nbytes = 0
+
+class ResultCache:
+    '''Bounded LRU/TTL cache of per-query results, dropped whenever the dataset version changes'''
+
+    def __init__(self, max_entries=256, max_bytes=64 * 2**20, ttl=3600, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.version = None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.nbytes = 0
+            self.version = version
+
+    def get(self, version, key, field):
+        '''Cached value or MISSING; a hit marks the query as most recently used'''
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry.created > self.ttl:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None or field not in entry.fields:
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry.fields[field]
+
+    def put(self, version, key, field, value):
+        size = estimate_bytes(value)
+        with self._lock:
+            self._check_version(version)
+            if size > self.max_bytes:
+                return
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = CacheEntry(self.clock())
+            elif field in entry.fields:
+                old = estimate_bytes(entry.fields[field])
+                entry.nbytes -= old
+                self.nbytes -= old
+            entry.fields[field] = value
+            entry.nbytes += size
+            self.nbytes += size
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_compute(self, version, key, field, compute):
+        value = self.get(version, key, field)
+        if value is MISSING:
+            value = compute()
+            self.put(version, key, field, value)
+
+        return value
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.nbytes -= entry.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "version": self.version,
+        }
@@ -0,0 +1,102 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from .utils import CHART_STYLES, render_histogram, hist_pricediff, hist_anngrowth
+
+'''
+Chart Rendering
+'''
+
+HISTOGRAMS = {'pricediff': hist_pricediff, 'anngrowth': hist_anngrowth}
+
+def histogram_key(counts, edges, style_name):
+    '''Identifies a chart by its bin counts, bin edges and style'''
+    digest = hashlib.sha1(style_name.encode())
+    digest.update(np.ascontiguousarray(counts, dtype='int64').tobytes())
+    digest.update(np.ascontiguousarray(edges, dtype='float64').tobytes())
+
+    return digest.hexdigest()
+
+class ChartRenderer:
+    '''Renders histogram PNGs on a bounded worker pool and never draws the same histogram twice'''
+
+    def __init__(self, max_workers=4, max_entries=512, processes=False, executor=None):
+        self.max_workers = max_workers
+        self.processes = processes
+        self.executor = executor
+        self.pool = None
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._pngs = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, counts, edges, style_name):
+        '''Future of the PNG bytes for a histogram; concurrent requests for the same one share a single render'''
+        key = histogram_key(counts, edges, style_name)
+        with self._lock:
+            png = self._pngs.get(key)
+            if png is not None:
+                self._pngs.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(png)
+                return future
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            self.misses += 1
+            future = self._pending[key] = self._executor().submit(render_histogram, counts, edges, CHART_STYLES[style_name])
+
+        # Registered outside the lock: the callback runs right here if the render already finished
+        future.add_done_callback(lambda done: self._finish(key, done))
+
+        return future
+
+    def render(self, counts, edges, style_name):
+        '''PNG bytes for a histogram, blocking until it is drawn'''
+        return self.submit(counts, edges, style_name).result()
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is not future:
+                return
+            del self._pending[key]
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._pngs[key] = future.result()
+            self._pngs.move_to_end(key)
+            while len(self._pngs) > self.max_entries:
+                self._pngs.popitem(last=False)
+
+    def _executor(self):
+        if self.executor is not None:
+            return self.executor
+        if self.pool is None:
+            executor = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+            self.pool = executor(max_workers=self.max_workers)
+
+        return self.pool
+
+    def chart(self, df, style_name):
+        '''PNG bytes of the named histogram for a filtered table, or None when it is empty'''
+        if len(df) == 0:
+            return None
+
+        return self.render(*HISTOGRAMS[style_name](df), style_name)
+
+    def clear(self):
+        with self._lock:
+            self._pngs.clear()
+
+    def stats(self):
+        return {"entries": len(self._pngs), "hits": self.hits, "misses": self.misses}
+
+    def shutdown(self):
+        with self._lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
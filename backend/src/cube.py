@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+'''
+Histogram Cube
+'''
+
+# Fixed bin grids in percent, starting at the -100% floor of both metrics. Values beyond the top edge
+# are left out of the charts, as growth above the baseline's 100% cap always was
+GRIDS = {
+    'pricediff': ('Price Differential (%)', np.linspace(-100, 1000, 1101)),
+    'anngrowth': ('Annualized Growth', np.linspace(-100, 100, 401)),
+}
+AREA_BUCKET = 100
+
+def grid_bins(values, edges):
+    '''Bin number of each value on a fixed grid, the top edge closing the last bin like np.histogram;
+    -1 for NaN and for values off the grid'''
+    bins = np.searchsorted(edges, values, side='right') - 1
+    bins[values == edges[-1]] = len(edges) - 2
+    bins[(bins < 0) | (bins > len(edges) - 2)] = -1
+
+    return bins
+
+def grid_histogram(df, name):
+    '''Counts of a filtered table on the named fixed grid, for queries the cube cannot answer'''
+    column, edges = GRIDS[name]
+    bins = grid_bins(df[column].to_numpy(dtype='float64') * 100, edges)
+
+    return np.bincount(bins[bins >= 0], minlength=len(edges) - 1)
+
+def area_slots(area, bucket=AREA_BUCKET):
+    '''Slot 2b holds areas exactly on the bucket edge b*bucket, slot 2b+1 those strictly inside bucket b'''
+    b = np.floor(area / bucket)
+    slots = 2 * b + (area != b * bucket)
+
+    return np.where(np.isnan(area), -1, slots).astype('int64')
+
+def chart_bins(counts, edges, max_bins=100):
+    '''Crops fixed-grid counts to their occupied span and merges neighbours down to at most max_bins'''
+    occupied = np.flatnonzero(counts)
+    if len(occupied) == 0:
+        return None
+    first, last = occupied[0], occupied[-1] + 1
+    factor = -(-(last - first) // max_bins)
+    n_bins = -(-(last - first) // factor)
+
+    merged = np.zeros(n_bins * factor, dtype='int64')
+    merged[:last - first] = counts[first:last]
+    width = (edges[1] - edges[0]) * factor
+
+    return merged.reshape(n_bins, factor).sum(axis=1), edges[first] + width * np.arange(n_bins + 1)
+
+class HistogramCube:
+    '''Fixed-grid bin counts per (project, property type, planning area, new-sale year, area slot) cell'''
+
+    def __init__(self, df, bucket=AREA_BUCKET):
+        self.bucket = bucket
+        self.codes = {}
+        dims = []
+        for col in ('Project Name', 'Property Type', 'Planning Area'):
+            codes, uniques = pd.factorize(df[col])
+            self.codes[col] = {value: code for code, value in enumerate(uniques.tolist())}
+            dims.append(codes)
+        dims.append(pd.to_datetime(df['New Sale Datetime']).dt.year.fillna(-1).to_numpy(dtype='int64'))
+        dims.append(area_slots(df['Area (SQFT)'].to_numpy(dtype='float64'), bucket))
+
+        self.cells, cell_of_row = np.unique(np.column_stack(dims), axis=0, return_inverse=True)
+        self.cell_of_row = cell_of_row = cell_of_row.reshape(-1)
+
+        # Sparse (cell, bin, count) entries, so memory stays bounded by the row count
+        self.entries = {}
+        for name, (column, edges) in GRIDS.items():
+            n_bins = len(edges) - 1
+            bins = grid_bins(df[column].to_numpy(dtype='float64') * 100, edges)
+            keep = bins >= 0
+            keys, counts = np.unique(cell_of_row[keep] * n_bins + bins[keep], return_counts=True)
+            self.entries[name] = (keys // n_bins, keys % n_bins, counts)
+
+    def cell_mask(self, propname, proptype, planarea, propsize_min, propsize_max, newsaleyear):
+        '''Cells making up the filter, or None when the area bounds fall between bucket edges'''
+        low, high = int(propsize_min), int(propsize_max)
+        if low % self.bucket or high % self.bucket:
+            return None
+        low, high = low // self.bucket, high // self.bucket
+
+        cells = self.cells
+        mask = np.ones(len(cells), dtype=bool)
+        for i, (col, value) in enumerate((('Project Name', propname), ('Property Type', proptype))):
+            if value != "All":
+                mask &= cells[:, i] == self.codes[col].get(value, -2)
+        if planarea != "All":
+            codes = [self.codes['Planning Area'].get(name, -2) for name in planarea.split(",")]
+            mask &= np.isin(cells[:, 2], codes)
+        if newsaleyear != "All":
+            mask &= cells[:, 3] >= int(newsaleyear)
+
+        slots = cells[:, 4]
+        bucket, on_edge = slots // 2, slots % 2 == 0
+        mask &= (slots >= 0) & (bucket >= low) & np.where(on_edge, bucket <= high, bucket < high)
+
+        return mask
+
+    def histogram(self, name, propname, proptype, planarea, propsize_min, propsize_max, newsaleyear):
+        '''Fixed-grid counts for a filter summed over its cells, or None if the cube cannot answer it'''
+        mask = self.cell_mask(propname, proptype, planarea, propsize_min, propsize_max, newsaleyear)
+        if mask is None:
+            return None
+        cell, bins, counts = self.entries[name]
+        keep = mask[cell]
+
+        return np.bincount(bins[keep], weights=counts[keep], minlength=len(GRIDS[name][1]) - 1).astype('int64')
@@ -0,0 +1,79 @@
+import base64
+import io
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+'''
+Transaction Export
+'''
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+CHUNK_ROWS = 10000
+
+def encode_cursor(version, position):
+    '''Opaque keyset cursor: the dataset version and the last row position already returned'''
+    return base64.urlsafe_b64encode("{}:{}".format(version, position).encode()).decode()
+
+def decode_cursor(cursor, version):
+    '''Row position a cursor resumes after; cursors from another dataset version are rejected'''
+    try:
+        cursor_version, position = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit(":", 1)
+        position = int(position)
+    except ValueError:
+        raise ValueError("malformed cursor")
+    if cursor_version != version:
+        raise ValueError("cursor belongs to an older dataset version; restart the export")
+
+    return position
+
+def select_columns(df, columns):
+    '''Requested columns in the requested order, or every column when none are given'''
+    if not columns:
+        return list(df.columns)
+    selected = [col.strip() for col in columns.split(",")]
+    unknown = [col for col in selected if col not in df.columns]
+    if unknown:
+        raise ValueError("unknown columns: {}".format(", ".join(unknown)))
+
+    return selected
+
+def page(positions, after=None, limit=None):
+    '''Ascending row positions past the cursor, at most limit of them, and the position to resume
+    after (None when this page reaches the end)'''
+    start = 0 if after is None else int(np.searchsorted(positions, after, side='right'))
+    stop = len(positions) if limit is None else min(len(positions), start + limit)
+    resume = int(positions[stop - 1]) if stop < len(positions) and stop > start else None
+
+    return positions[start:stop], resume
+
+def stream_rows(df, positions, columns, format, chunk_rows=CHUNK_ROWS):
+    '''Yields the selected rows encoded chunk by chunk, so memory stays bounded by chunk_rows'''
+    writer, sink = None, None
+    for i, start in enumerate(range(0, max(len(positions), 1), chunk_rows)):
+        chunk = df.iloc[positions[start:start + chunk_rows]][columns]
+        if format == 'ndjson':
+            if len(chunk):
+                text = chunk.to_json(orient='records', lines=True, date_format='iso')
+                yield (text if text.endswith("\n") else text + "\n").encode()
+        elif format == 'csv':
+            yield chunk.to_csv(index=False, header=i == 0).encode()
+        else:
+            batch = pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                sink = io.BytesIO()
+                writer = pa.ipc.new_stream(sink, batch.schema)
+            writer.write_batch(batch)
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    if writer is not None:
+        writer.close()
+        yield sink.getvalue()
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+'''
+Filter Index
+'''
+
+EMPTY = np.empty(0, dtype=np.int64)
+
+def positions_by_value(values):
+    '''Maps each distinct value to the ascending row positions holding it'''
+    codes, uniques = pd.factorize(values)
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    skip = int((codes < 0).sum())
+    groups = np.split(order[skip:], np.cumsum(counts)[:-1]) if len(uniques) else []
+
+    return dict(zip(uniques.tolist(), groups))
+
+class SortedColumn:
+    '''Row positions ordered by a numeric column, for binary-search range lookups'''
+
+    def __init__(self, values):
+        self.values = np.asarray(values)
+        self.order = np.argsort(self.values, kind='stable')
+        self.sorted = self.values[self.order]
+
+    def bounds(self, low=None, high=None):
+        '''Slice of the sorted order holding low <= value <= high'''
+        start = 0 if low is None else np.searchsorted(self.sorted, low, side='left')
+        stop = len(self.sorted) if high is None else np.searchsorted(self.sorted, high, side='right')
+
+        return start, stop
+
+    def range_positions(self, low=None, high=None):
+        '''Positions with low <= value <= high, in column order'''
+        start, stop = self.bounds(low, high)
+
+        return np.sort(self.order[start:stop])
+
+    def mask(self, positions, low=None, high=None):
+        values = self.values[positions]
+        keep = np.ones(len(positions), dtype=bool)
+        if low is not None:
+            keep &= values >= low
+        if high is not None:
+            keep &= values <= high
+
+        return keep
+
+class FilterIndex:
+    '''Prebuilt row positions for every filter dimension used by get_filtered_table'''
+
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self.project = positions_by_value(df['Project Name'])
+        self.proptype = positions_by_value(df['Property Type'])
+        self.planarea = positions_by_value(df['Planning Area'])
+        self.mktsegment = positions_by_value(df['Market Segment'])
+        sale_years = pd.to_datetime(df['New Sale Datetime']).dt.year.to_numpy()
+        self.saleyear = SortedColumn(sale_years)
+        self.area = SortedColumn(df['Area (SQFT)'].to_numpy())
+
+    def positions(self, propname, proptype, planarea, propsize_min, propsize_max, newsaleyear, mktsegment="All"):
+        '''Ascending row positions matching the same parameters as get_filtered_table'''
+        sets = []
+        if propname != "All":
+            sets.append(self.project.get(propname, EMPTY))
+        if proptype != "All":
+            sets.append(self.proptype.get(proptype, EMPTY))
+        if planarea != "All":
+            areas = [self.planarea.get(name, EMPTY) for name in set(planarea.split(","))]
+            sets.append(np.sort(np.concatenate(areas)))
+        if mktsegment != "All":
+            sets.append(self.mktsegment.get(mktsegment, EMPTY))
+
+        ranges = [(self.area, int(propsize_min), int(propsize_max))]
+        if newsaleyear != "All":
+            ranges.append((self.saleyear, int(newsaleyear), None))
+
+        if sets:
+            sets.sort(key=len)
+            positions = sets[0]
+            for other in sets[1:]:
+                if len(positions) == 0:
+                    break
+                positions = np.intersect1d(positions, other, assume_unique=True)
+        else:
+            # No categorical filter: start from the narrower of the range lookups
+            sizes = []
+            for column, low, high in ranges:
+                start, stop = column.bounds(low, high)
+                sizes.append(stop - start)
+            column, low, high = ranges.pop(int(np.argmin(sizes)))
+            positions = column.range_positions(low, high)
+
+        for column, low, high in ranges:
+            positions = positions[column.mask(positions, low, high)]
+
+        return positions
+
@@ -0,0 +1,103 @@
+import bisect
+import threading
+
+'''
+Request and Stage Metrics
+'''
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000, 10000000)
+
+def format_labels(names, values):
+    return ",".join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in zip(names, values))
+
+class Histogram:
+    '''Fixed-bucket histogram per label value, rendered in the Prometheus text format'''
+
+    def __init__(self, name, help, buckets, label):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label = label
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} histogram".format(self.name)]
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self.series.items()}
+        for label_value, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(self.name, format_labels([self.label], [label_value]), bound, cumulative))
+            labels = format_labels([self.label], [label_value])
+            lines.append("{}_sum{{{}}} {}".format(self.name, labels, total))
+            lines.append("{}_count{{{}}} {}".format(self.name, labels, cumulative))
+
+        return lines
+
+class Counter:
+    def __init__(self, name, help, labels, kind="counter"):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.kind = kind
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} {}".format(self.name, self.kind)]
+        with self._lock:
+            values = dict(self.values)
+        for label_values, value in sorted(values.items()):
+            labels = "{{{}}}".format(format_labels(self.labels, label_values)) if self.labels else ""
+            lines.append("{}{} {}".format(self.name, labels, value))
+
+        return lines
+
+class Metrics:
+    '''Per-endpoint and per-stage latency histograms, filter result sizes, request counts by status
+    and in-flight requests. Observing is a bisect and a locked increment, cheap enough to leave on'''
+
+    def __init__(self, prefix="propalantir"):
+        self.prefix = prefix
+        self.request_seconds = Histogram(prefix + "_request_duration_seconds", "Request latency by endpoint", LATENCY_BUCKETS, "endpoint")
+        self.stage_seconds = Histogram(prefix + "_stage_duration_seconds", "Time spent in each processing stage", LATENCY_BUCKETS, "stage")
+        self.result_rows = Histogram(prefix + "_result_rows", "Rows produced by a stage", ROW_BUCKETS, "stage")
+        self.requests = Counter(prefix + "_requests_total", "Requests by endpoint and status code", ("endpoint", "status"))
+        self.in_flight = Counter(prefix + "_requests_in_flight", "Requests currently being served", (), kind="gauge")
+
+    def observe_stage(self, name, seconds, rows=None):
+        '''Stage observer for utils.STAGE_OBSERVERS'''
+        self.stage_seconds.observe(name, seconds)
+        if rows is not None:
+            self.result_rows.observe(name, rows)
+
+    def observe_request(self, endpoint, status, seconds):
+        self.request_seconds.observe(endpoint, seconds)
+        self.requests.inc((endpoint, status))
+
+    def render(self, gauges=None):
+        '''Prometheus text exposition; gauges maps extra metric names (without the prefix) to values'''
+        lines = []
+        for metric in (self.requests, self.in_flight, self.request_seconds, self.stage_seconds, self.result_rows):
+            lines.extend(metric.render())
+        for name, value in sorted((gauges or {}).items()):
+            lines.append("# TYPE {}_{} gauge".format(self.prefix, name))
+            lines.append("{}_{} {}".format(self.prefix, name, value))
+
+        return "\n".join(lines) + "\n"
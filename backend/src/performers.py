@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+from .utils import get_performers
+
+'''
+Top/Bottom Performers
+'''
+
+PERFORMER_KEYS = ['Project Name','Property Type','Planning Area']
+RANK_COLUMN = 'Median Annualized Growth (%)'
+
+def select_extremes(values, n):
+    '''Positions of the n largest values and of the last n in descending order with NaN last,
+    i.e. what head(n) and tail(n) of a full descending sort would show, found by partial selection'''
+    missing = np.isnan(values)
+    finite, nan_positions = np.flatnonzero(~missing), np.flatnonzero(missing)
+    ranked = values[finite]
+
+    def descending(chosen):
+        return chosen[np.lexsort((chosen, -values[chosen]))]
+
+    k = min(n, len(finite))
+    top = finite if k == len(finite) else finite[np.argpartition(-ranked, k - 1)[:k]]
+    top = descending(top)
+    if len(top) < n:
+        top = np.concatenate([top, nan_positions[:n - len(top)]])
+
+    n_nan = min(n, len(nan_positions))
+    k = min(n - n_nan, len(finite))
+    if k == len(finite):
+        bottom = finite
+    elif k == 0:
+        bottom = finite[:0]
+    else:
+        bottom = finite[np.argpartition(ranked, k - 1)[:k]]
+    bottom = np.concatenate([descending(bottom), nan_positions[len(nan_positions) - n_nan:]])
+
+    return top, bottom
+
+class ProjectAggregates:
+    '''get_performers rows for every (project, type, planning area) group, precomputed over all of its
+    transactions, plus each group's area and new-sale year range to tell when a filter keeps it whole'''
+
+    def __init__(self, df):
+        group_ids = df.groupby(PERFORMER_KEYS, observed=True, sort=False).ngroup()
+        self.group_of_row = group_ids.fillna(-1).to_numpy(dtype='int64')
+
+        # NaN areas and dates make a group ineligible for the whole-group shortcut
+        area = df['Area (SQFT)'].to_numpy(dtype='float64')
+        year = pd.to_datetime(df['New Sale Datetime']).dt.year.fillna(-1).to_numpy(dtype='int64')
+        ranges = pd.DataFrame({
+            'group': self.group_of_row,
+            'min_area': np.where(np.isnan(area), -np.inf, area),
+            'max_area': np.where(np.isnan(area), np.inf, area),
+            'min_year': year,
+            'max_year': year,
+        }).query('group >= 0').groupby('group').agg({'min_area': 'min', 'max_area': 'max', 'min_year': 'min', 'max_year': 'max'})
+
+        groups, first_rows = np.unique(self.group_of_row, return_index=True)
+        group_keys = df.iloc[first_rows[groups >= 0]][PERFORMER_KEYS].astype('object').assign(group=groups[groups >= 0])
+        table = get_performers(df).reset_index()
+        table = table.astype({col: 'object' for col in PERFORMER_KEYS}).merge(group_keys, on=PERFORMER_KEYS, how='left')
+        self.table = table.drop(columns=['group'])
+        self.group = table['group'].to_numpy(dtype='int64')
+        for col in ranges.columns:
+            setattr(self, col, ranges[col].to_numpy()[self.group])
+
+    def top_bottom(self, df, index, query, n=10):
+        '''(top, bottom) performer tables for a filter. Groups the filter keeps whole come from the
+        precomputed rows; only groups it cuts through are re-aggregated from their matching rows'''
+        propname, proptype, planarea, propsize_min, propsize_max, newsaleyear = query
+        low, high = int(propsize_min), int(propsize_max)
+
+        selected = np.ones(len(self.table), dtype=bool)
+        if propname != "All":
+            selected &= (self.table['Project Name'] == propname).to_numpy()
+        if proptype != "All":
+            selected &= (self.table['Property Type'] == proptype).to_numpy()
+        if planarea != "All":
+            selected &= self.table['Planning Area'].isin(planarea.split(",")).to_numpy()
+        whole = selected & (self.min_area >= low) & (self.max_area <= high)
+        disjoint = (self.max_area < low) | (self.min_area > high)
+        if newsaleyear != "All":
+            whole &= self.min_year >= int(newsaleyear)
+            disjoint |= self.max_year < int(newsaleyear)
+        partial = selected & ~whole & ~disjoint
+
+        table = self.table.loc[whole]
+        if partial.any():
+            positions = index.positions(*query)
+            cut_groups = np.zeros(self.group.max() + 1, dtype=bool)
+            cut_groups[self.group[partial]] = True
+            groups = self.group_of_row[positions]
+            rows = positions[(groups >= 0) & cut_groups[np.maximum(groups, 0)]]
+            if len(rows):
+                table = pd.concat([table, get_performers(df.iloc[rows]).reset_index()], ignore_index=True)
+
+        top, bottom = select_extremes(table[RANK_COLUMN].to_numpy(dtype='float64'), n)
+
+        return table.iloc[top].set_index('Project Name'), table.iloc[bottom].set_index('Project Name')
@@ -1,39 +1,54 @@
+import argparse
+import os
+import sys
 import pandas as pd
-from utils import clean_table, match_newsale_resale, assign_mktsegment, convert_datetimes, add_metrics_cols
 
-realis_data = 'backend/data/realis.csv'
-
-df = pd.read_csv(realis_data)
-
-df = clean_table(df)
-
-df = match_newsale_resale(df)
-
-df = assign_mktsegment(df)
+# Imported as the backend package, like the server, so the store can save the prebuilt structures
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from src.utils import PIPELINES, RAW_COLUMNS, clean_table, process_table, process_chunked, ingest_state, write_state, apply_schema, write_columnar, columnar_path
+from src.store import publish_columnar
 
-df = convert_datetimes(df)
-
-df = add_metrics_cols(df)
-
-df = df[[
-    'Project Name',
-    'New Sale Price ($)',
-    'New Sale Price (PSF)',
-    'Area (SQFT)',
-    'Address',
-    'Property Type',
-    'Tenure',
-    'Postal District',
-    'Planning Region',
-    'Planning Area',
-    'Resale Price ($)',
-    'Resale Price (PSF)',
-    'Market Segment',
-    'New Sale Datetime',
-    'Resale Datetime',
-    'Property Age (Years)',
-    'Price Differential (%)',
-    'Annualized Growth'
-]]
-
-df.to_csv('backend/data/realis_processed.csv', index=False)
\ No newline at end of file
+realis_data = 'backend/data/realis.csv'
+realis_processed = 'backend/data/realis_processed.csv'
+realis_state = 'backend/data/realis_state'
+
+parser = argparse.ArgumentParser(description='Builds the processed REALIS table served by the backend')
+parser.add_argument('--input', default=realis_data)
+parser.add_argument('--output', default=realis_processed)
+parser.add_argument('--state', default=realis_state,
+                    help='directory of cleaned raw history and processed rows, partitioned by project address, kept for incremental runs')
+parser.add_argument('--increment', metavar='CSV',
+                    help='raw export holding only new rows; upserts them into the state partitions and the columnar '
+                         'artifact instead of rebuilding (the processed CSV is only written by full builds)')
+parser.add_argument('--columnar',
+                    help='typed columnar artifact loaded by the server (default: next to --output)')
+parser.add_argument('--chunksize', type=int,
+                    help='stream the raw export in chunks of this many rows, spilling partitions to disk')
+parser.add_argument('--partitions', type=int, default=64,
+                    help='number of project address partitions used for the state and with --chunksize')
+parser.add_argument('--spill-dir',
+                    help='directory for the temporary partition files (default: system temp dir)')
+parser.add_argument('--mode', choices=list(PIPELINES), default='vectorized',
+                    help='rowwise runs the original per-row apply stages')
+args = parser.parse_args()
+columnar = args.columnar or columnar_path(args.output)
+
+if args.increment:
+    # Also saves the prebuilt structures inside the reassembled artifact before swapping it in
+    ingest_state(args.state, pd.read_csv(args.increment, usecols=RAW_COLUMNS), columnar, args.mode)
+
+elif args.chunksize:
+    # Output, state and columnar artifact are written partition by partition
+    process_chunked(args.input, args.output, args.chunksize, args.partitions, args.mode,
+                    state_dir=args.state, spill_dir=args.spill_dir, columnar=columnar)
+    publish_columnar(columnar)
+
+else:
+    df_state = clean_table(pd.read_csv(args.input, usecols=RAW_COLUMNS))
+
+    df = apply_schema(process_table(df_state, args.mode, cleaned=True))
+    df.to_csv(args.output, index=False)
+    write_state(args.state, df_state, df, args.partitions)
+    write_columnar(df.reset_index(drop=True), columnar)
+    # Prebuilt structures saved inside the artifact, so server workers map them instead of building their own
+    publish_columnar(columnar)
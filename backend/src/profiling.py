@@ -0,0 +1,99 @@
+import contextvars
+import cProfile
+import hashlib
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+'''
+Request Profiling
+'''
+
+PROFILE_HEADER = "x-profile"
+PROFILE_PARAM = "profile"
+FILTER_PARAMS = ("propname", "proptype", "planarea", "propsize_min", "propsize_max", "newsaleyear")
+
+# The RequestProfile of the request being handled, if any; its work then runs under that profiler instead of on the pool
+profiling = contextvars.ContextVar("profiling", default=None)
+
+def profile_requested(headers, query_params):
+    '''True when the request carries X-Profile: 1 or ?profile=1'''
+    flag = headers.get(PROFILE_HEADER) or query_params.get(PROFILE_PARAM) or ""
+
+    return flag.lower() in ("1", "true", "yes")
+
+def profile_tag(query_params, normalize):
+    '''Filter parameters of a request, normalized when all of them are present'''
+    if all(name in query_params for name in FILTER_PARAMS):
+        try:
+            return list(normalize(*(query_params[name] for name in FILTER_PARAMS)))
+        except ValueError:
+            pass
+
+    return {name: value for name, value in query_params.items() if name != PROFILE_PARAM}
+
+class RequestProfile:
+    '''cProfile plus tracemalloc around one request. The request's work is profiled through run() on the
+    thread it is handed to, so the event loop keeps serving other requests meanwhile. tracemalloc is
+    process-wide, so the allocation figures also count those other requests. On exit writes <name>.prof
+    (pstats) and <name>.txt with the filter parameters, the hottest functions and the top allocation sites'''
+
+    def __init__(self, directory, endpoint, tag, top=30):
+        self.directory = directory
+        self.endpoint = endpoint
+        self.tag = tag
+        self.top = top
+        digest = hashlib.sha1(json.dumps(tag, sort_keys=True).encode()).hexdigest()[:10]
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        self.name = "{}_{}_{}".format(stamp, endpoint.strip("/").replace("/", "_") or "root", digest)
+        self.profiler = cProfile.Profile()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start(10)
+        tracemalloc.reset_peak()
+        self._token = profiling.set(self)
+        self._start = time.perf_counter()
+
+        return self
+
+    def run(self, fn, *args):
+        '''fn(*args) under the profiler on the calling thread; calls are profiled one at a time'''
+        with self._lock:
+            self.profiler.enable()
+            try:
+                return fn(*args)
+            finally:
+                self.profiler.disable()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._start
+        profiling.reset(self._token)
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._started_tracing:
+            tracemalloc.stop()
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self.name)
+        self.profiler.dump_stats(path + ".prof")
+
+        hot = io.StringIO()
+        pstats.Stats(self.profiler, stream=hot).sort_stats("cumulative").print_stats(self.top)
+        allocations = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics("lineno")
+        with open(path + ".txt", "w") as f:
+            f.write("endpoint: {}\nfilter: {}\nseconds: {:.6f}\ntraced peak bytes (process-wide): {}\n\n".format(
+                self.endpoint, json.dumps(self.tag), seconds, peak))
+            f.write("top allocation sites (process-wide, including requests served meanwhile)\n")
+            for stat in allocations[:self.top]:
+                f.write("{}\n".format(stat))
+            f.write("\n" + hot.getvalue())
+
+        return False
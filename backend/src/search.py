@@ -0,0 +1,99 @@
+import bisect
+import re
+import numpy as np
+
+'''
+Project Name Search
+'''
+
+TOKEN = re.compile(r"[a-z0-9]+")
+# Sorts after any character a normalized key can contain, closing a prefix range
+PREFIX_END = "\uffff"
+
+def search_key(text):
+    '''Casefolded alphanumeric tokens of a name or query, e.g. "The Sail @ Marina" -> ["the", "sail", "marina"]'''
+    return TOKEN.findall(str(text).casefold())
+
+def trigrams(key):
+    '''Distinct three-character pieces of a normalized name, padded so word starts and ends count'''
+    padded = " {} ".format(key)
+
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def prefix_range(keys, prefix):
+    return bisect.bisect_left(keys, prefix), bisect.bisect_left(keys, prefix + PREFIX_END)
+
+class ProjectSearch:
+    '''Prebuilt lookup over the distinct project names. Names are numbered by transaction count, most
+    traded first, so any set of matching ids sorts straight into ranking order. Whole names and single
+    words are kept as sorted arrays, making a prefix lookup two binary searches. Misspelled queries are
+    scored against a trigram index, touching only the names that share a trigram with them'''
+
+    def __init__(self, df):
+        counts = df['Project Name'].dropna().astype(str).value_counts()
+        ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        self.names = [name for name, _ in ranked]
+
+        keys = sorted((" ".join(search_key(name)), i) for i, name in enumerate(self.names))
+        self.keys = [key for key, _ in keys]
+        self.key_ids = np.array([i for _, i in keys], dtype=np.int64)
+
+        tokens = sorted({(token, i) for i, name in enumerate(self.names) for token in search_key(name)})
+        self.tokens = [token for token, _ in tokens]
+        self.token_ids = np.array([i for _, i in tokens], dtype=np.int64)
+
+        self.name_keys = [None] * len(self.names)
+        for key, i in keys:
+            self.name_keys[i] = key
+        grams = sorted((gram, i) for i, key in enumerate(self.name_keys) for gram in trigrams(key))
+        self.grams = [gram for gram, _ in grams]
+        self.gram_ids = np.array([i for _, i in grams], dtype=np.int64)
+        self.gram_counts = np.bincount(self.gram_ids, minlength=len(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, query, limit=10):
+        '''Up to limit project names for a search box, ranked by how they match and then by transaction
+        count: the exact name, names starting with the query, names with a word starting with every query
+        word, and only when none of those match, close spellings of the whole name. An empty query
+        returns the most traded projects'''
+        words = search_key(query)
+        if not words:
+            return self.names[:limit]
+        key = " ".join(words)
+
+        lo, hi = prefix_range(self.keys, key)
+        exact = self.key_ids[lo:bisect.bisect_right(self.keys, key, lo, hi)]
+        starts = self.key_ids[lo:hi]
+        contains = None
+        for word in words:
+            lo, hi = prefix_range(self.tokens, word)
+            ids = np.unique(self.token_ids[lo:hi])
+            contains = ids if contains is None else np.intersect1d(contains, ids, assume_unique=True)
+            if len(contains) == 0:
+                break
+
+        results = []
+        for tier in (exact, starts, contains):
+            for i in np.sort(tier)[:limit]:
+                if self.names[i] not in results:
+                    results.append(self.names[i])
+            if len(results) >= limit:
+                break
+        if not results:
+            results = [self.names[i] for i in self.close_matches(key, limit)]
+
+        return results[:limit]
+
+    def close_matches(self, key, limit, cutoff=0.4):
+        '''Ids of names spelled like key, best first: names are scored by the Dice overlap of their
+        trigrams with the query's, read off the postings of the query trigrams alone, and kept above cutoff'''
+        grams = trigrams(key)
+        postings = [self.gram_ids[bisect.bisect_left(self.grams, gram):bisect.bisect_right(self.grams, gram)] for gram in grams]
+        shared = np.bincount(np.concatenate(postings + [self.gram_ids[:0]]), minlength=len(self.names))
+        score = 2 * shared / (len(grams) + self.gram_counts)
+        ids = np.flatnonzero(score >= cutoff)
+        # Ids are in transaction order, so a stable sort breaks score ties by trading volume
+
+        return ids[np.argsort(-score[ids], kind='stable')[:limit]].tolist()
@@ -0,0 +1,140 @@
+import numpy as np
+
+'''
+Approximate Stats
+'''
+
+STAT_COLUMNS = ['Price Differential (%)', 'Annualized Growth', 'Property Age (Years)']
+QUANTILES = {'25%': 0.25, '50%': 0.5, '75%': 0.75}
+# Cube cell dimensions a sketch group spans: property type, planning area and new-sale year. Filters on
+# those select whole groups; only the project and area filters cut through them
+GROUP_DIMS = [1, 2, 3]
+
+def runs(starts, counts):
+    '''Positions covered by the runs [start, start + count), in order'''
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+
+    return offsets + np.arange(len(offsets))
+
+class ColumnSketch:
+    '''Per-cell moments plus a rank summary per group of cells keeping every k-th sorted value with
+    weight k, where k = max(1, floor(eps * group size)); the group's largest value carries what is left.
+    Counting the kept weights up to any value undercounts the group by at most k - 1. A filter takes the
+    summaries of the groups it mostly selects, minus the exact values of their unselected cells, and the
+    exact values of the cells it picks out of other groups, so its rank error is at most the sum of
+    those groups' k - 1: eps of their rows, and 0 with eps=0. Samples and values are kept in value
+    order, so a filter only sorts the positions of the values it reads exactly'''
+
+    def __init__(self, values, cell_of_row, n_cells, group_of_cell, n_groups, eps):
+        keep = ~np.isnan(values)
+        values, cells = values[keep], cell_of_row[keep]
+        order = np.argsort(values, kind='stable')
+        self.sorted_value = values[order]
+        sorted_cell = cells[order]
+
+        self.count = np.bincount(cells, minlength=n_cells)
+        # Value-order positions of each cell's values, cell after cell
+        self.cell_start = np.cumsum(self.count) - self.count
+        self.cell_positions = np.argsort(sorted_cell, kind='stable').astype('int32')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.bincount(cells, weights=values, minlength=n_cells) / self.count
+            self.m2 = np.bincount(cells, weights=(values - self.mean[cells])**2, minlength=n_cells)
+        self.min = np.full(n_cells, np.nan)
+        self.max = np.full(n_cells, np.nan)
+        np.fmin.at(self.min, cells, values)
+        np.fmax.at(self.max, cells, values)
+
+        self.group_of_cell = group_of_cell
+        groups = group_of_cell[sorted_cell]
+        order = np.argsort(groups, kind='stable')
+        values, groups = self.sorted_value[order], groups[order]
+        self.group_count = np.bincount(groups, minlength=n_groups)
+        self.stride = np.maximum(1, np.floor(eps * self.group_count)).astype('int64')
+        rank = np.arange(len(values)) - (np.cumsum(self.group_count) - self.group_count)[groups]
+        stride = self.stride[groups]
+        kept = np.flatnonzero(((rank + 1) % stride == 0) | (rank == self.group_count[groups] - 1))
+        weight = np.where((rank[kept] + 1) % stride[kept] == 0, stride[kept], (rank[kept] + 1) % stride[kept])
+        # Back in value order, like the values themselves
+        order = np.argsort(values[kept], kind='stable')
+        self.sample_value, self.sample_weight, self.sample_group = values[kept][order], weight[order], groups[kept][order]
+
+    def describe(self, mask):
+        '''describe()-style dict for the cells in mask, with the guaranteed rank error as a fraction of count'''
+        n = self.count[mask]
+        total = int(n.sum())
+        if total == 0:
+            return dict.fromkeys(['count', 'mean', 'std', 'min', *QUANTILES, 'max'], 0.0), 0.0
+
+        occupied = n > 0
+        n, mean, m2 = n[occupied], self.mean[mask][occupied], self.m2[mask][occupied]
+        mu = float(np.sum(n * mean) / total)
+        spread = float(np.sum(m2) + np.sum(n * (mean - mu)**2))
+        stats = {
+            'count': float(total),
+            'mean': mu,
+            'std': float(np.sqrt(spread / (total - 1))) if total > 1 else 0,
+            'min': float(np.min(self.min[mask][occupied])),
+        }
+
+        # Groups at least half selected are summarized, the rest read exactly
+        selected = np.bincount(self.group_of_cell, weights=np.where(mask, self.count, 0), minlength=len(self.group_count))
+        summarized = (selected > 0) & (2 * selected >= self.group_count)
+        sampled = summarized[self.sample_group]
+        values, weights = self.sample_value[sampled], self.sample_weight[sampled]
+        # +1 for cells read exactly, -1 for unselected cells of summarized groups
+        sign = np.where(summarized[self.group_of_cell], np.where(mask, 0, -1), np.where(mask, 1, 0))
+        cells = np.flatnonzero(sign * self.count)
+        if len(cells):
+            positions = self.cell_positions[runs(self.cell_start[cells], self.count[cells])]
+            order = np.argsort(positions)
+            exact_weights = np.repeat(sign[cells], self.count[cells])[order]
+            values = np.concatenate([values, self.sorted_value[positions[order]]])
+            weights = np.concatenate([weights, exact_weights])
+            # Two sorted runs, which a stable sort merges in linear time
+            order = np.argsort(values, kind='stable')
+            values, weights = values[order], weights[order]
+        counted = np.cumsum(weights)
+        # Counts at the last of each run of equal values; taking the running maximum keeps them
+        # within the same bounds as the true, non-decreasing counts
+        last = np.append(values[1:] != values[:-1], True)
+        values, counted = values[last], np.maximum.accumulate(counted[last])
+        value_at = lambda rank: values[np.searchsorted(counted, rank + 1)]
+        for label, q in QUANTILES.items():
+            position = q * (total - 1)
+            low, high = value_at(int(np.floor(position))), value_at(int(np.ceil(position)))
+            stats[label] = float(low + (position - np.floor(position)) * (high - low))
+        stats['max'] = float(np.max(self.max[mask][occupied]))
+        rank_error = float(np.sum(self.stride[summarized] - 1) / total)
+
+        return stats, rank_error
+
+class StatsSketch:
+    '''Mergeable sketches of the get_stats columns over the histogram cube's cells, summarized per
+    property type, planning area and new-sale year'''
+
+    def __init__(self, df, cube, eps=0.01):
+        self.cube = cube
+        self.eps = eps
+        groups, group_of_cell = np.unique(cube.cells[:, GROUP_DIMS], axis=0, return_inverse=True)
+        group_of_cell = group_of_cell.reshape(-1)
+        self.columns = {col: ColumnSketch(df[col].to_numpy(dtype='float64'), cube.cell_of_row, len(cube.cells), group_of_cell, len(groups), eps)
+                        for col in STAT_COLUMNS}
+
+    def samples(self):
+        return sum(len(sketch.sample_value) for sketch in self.columns.values())
+
+    def count(self, mask):
+        return int(self.columns[STAT_COLUMNS[0]].count[mask].sum())
+
+    def stats(self, propname, proptype, planarea, propsize_min, propsize_max, newsaleyear):
+        '''(stat_dict, rank_error) shaped like get_stats, or None when the cube cannot answer the filter'''
+        mask = self.cube.cell_mask(propname, proptype, planarea, propsize_min, propsize_max, newsaleyear)
+
+        return None if mask is None else self.describe(mask)
+
+    def describe(self, mask):
+        dict_stats, rank_error = {}, {}
+        for col, sketch in self.columns.items():
+            dict_stats[col], rank_error[col] = sketch.describe(mask)
+
+        return dict_stats, rank_error
@@ -0,0 +1,176 @@
+import hashlib
+import mmap
+import os
+import pickle
+import threading
+from collections import namedtuple
+from .utils import read_columnar, read_dataset, read_processed_table, write_columnar, columnar_path, swap_directory
+from .index import FilterIndex
+from .cube import HistogramCube
+from .sketch import StatsSketch
+from .performers import ProjectAggregates
+from .search import ProjectSearch
+
+'''
+Resident Dataset Store
+'''
+
+DATA_FILE = os.environ.get("PROPALANTIR_DATA_FILE", "data/realis_processed.csv")
+DERIVED_FILE = "derived.pkl"
+DERIVED_BUFFERS = "derived.bin"
+BUFFER_ALIGN = 64
+
+def default_data_path(csv_file=DATA_FILE):
+    '''Prefers the memory-mapped columnar artifact when the pipeline has written one'''
+    if os.path.isdir(columnar_path(csv_file)):
+        return columnar_path(csv_file)
+
+    return csv_file
+
+def build_structures(df):
+    '''The prebuilt lookup structures of a DatasetView, in field order'''
+    cube = HistogramCube(df)
+
+    return FilterIndex(df), cube, StatsSketch(df, cube), ProjectAggregates(df), ProjectSearch(df)
+
+def columns_stamp(path):
+    '''Size and modification time of a columnar artifact's manifest; unlike the version, moving the
+    directory into place keeps it'''
+    stat = os.stat(os.path.join(path, "manifest.json"))
+
+    return [stat.st_size, stat.st_mtime_ns]
+
+def write_derived(path, structures):
+    '''Saves prebuilt structures inside a columnar artifact. They are pickled with every array kept out
+    of band in one aligned file, which read_derived maps, so worker processes share those pages'''
+    buffers = []
+    data = pickle.dumps(structures, protocol=5, buffer_callback=buffers.append)
+    spans = []
+    with open(os.path.join(path, DERIVED_BUFFERS + ".tmp"), "wb") as f:
+        for buffer in buffers:
+            f.write(b"\0" * (-f.tell() % BUFFER_ALIGN))
+            raw = buffer.raw()
+            spans.append((f.tell(), raw.nbytes))
+            f.write(raw)
+    with open(os.path.join(path, DERIVED_FILE + ".tmp"), "wb") as f:
+        pickle.dump({"columns": columns_stamp(path), "spans": spans, "pickle": data}, f)
+    os.replace(os.path.join(path, DERIVED_BUFFERS + ".tmp"), os.path.join(path, DERIVED_BUFFERS))
+    os.replace(os.path.join(path, DERIVED_FILE + ".tmp"), os.path.join(path, DERIVED_FILE))
+
+def read_derived(path):
+    '''Structures saved by write_derived with their arrays mapped read-only, or None when they are
+    missing or were built from other columns'''
+    try:
+        with open(os.path.join(path, DERIVED_FILE), "rb") as f:
+            saved = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    if saved["columns"] != columns_stamp(path):
+        return None
+
+    with open(os.path.join(path, DERIVED_BUFFERS), "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        mapped = memoryview(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else b"")
+
+    return pickle.loads(saved["pickle"], buffers=[mapped[start:start + n] for start, n in saved["spans"]])
+
+def publish_structures(path):
+    '''Saves the prebuilt structures inside a columnar artifact unless ones matching its columns are there'''
+    if read_derived(path) is None:
+        write_derived(path, build_structures(read_columnar(path)))
+
+    return path
+
+def publish_columnar(path=DATA_FILE):
+    '''Makes sure a columnar artifact with its prebuilt structures is there to serve. Given a processed CSV,
+    the artifact next to it is built unless an up-to-date one exists; given an artifact, only its
+    structures are. Worker processes that load it then all map the same read-only column and structure
+    files instead of each building their own'''
+    if os.path.isdir(path):
+        return publish_structures(path)
+
+    csv_file, path = path, columnar_path(path)
+    manifest = os.path.join(path, "manifest.json")
+    if not os.path.exists(manifest) or os.stat(manifest).st_mtime_ns < os.stat(csv_file).st_mtime_ns:
+        # Written aside and swapped in; workers still mapping the old files keep their pages
+        staging = path + ".tmp{}".format(os.getpid())
+        write_columnar(read_processed_table(csv_file), staging)
+        write_derived(staging, build_structures(read_columnar(staging)))
+        swap_directory(staging, path)
+
+        return path
+
+    return publish_structures(path)
+
+def file_fingerprint(path):
+    '''Short hash of a file's path, size and modification time, used as the dataset version'''
+    if os.path.isdir(path):
+        path = os.path.join(path, "manifest.json")
+    stat = os.stat(path)
+    key = "{}:{}:{}".format(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+DatasetView = namedtuple('DatasetView', ['df', 'index', 'cube', 'sketch', 'performers', 'search', 'version'])
+
+class DatasetStore:
+    '''Keeps the processed transaction table in memory so requests never re-read the source file'''
+
+    def __init__(self, path=None):
+        self.path = default_data_path() if path is None else path
+        self._state = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._state is not None
+
+    @property
+    def version(self):
+        return None if self._state is None else self._state.version
+
+    def load(self):
+        '''Builds the table once; later calls are no-ops'''
+        with self._lock:
+            if self._state is None:
+                self._load()
+
+        return self
+
+    def reload(self):
+        '''Re-reads the source and swaps it in; snapshots already handed out are unaffected'''
+        with self._lock:
+            self._load()
+
+        return self
+
+    def _load(self):
+        version = file_fingerprint(self.path)
+        df = read_dataset(self.path)
+        structures = read_derived(self.path) if os.path.isdir(self.path) else None
+        if structures is None:
+            structures = build_structures(df)
+        self._state = DatasetView(df, *structures, version)
+
+    def current(self):
+        '''The table with its prebuilt structures and version, swapped atomically on reload'''
+        state = self._state
+        if state is None:
+            raise RuntimeError("Dataset store has not been loaded")
+
+        return state
+
+    def snapshot(self):
+        '''Returns the current table; callers must treat it as read-only'''
+        return self.current().df.copy(deep=False)
+
+    def positions(self, propname, proptype, planarea, propsize_min, propsize_max, newsaleyear):
+        '''Row positions of the current table matching the filter, answered from the index'''
+        return self.current().index.positions(propname, proptype, planarea, propsize_min, propsize_max, newsaleyear)
+
+    def select(self, propname, proptype, planarea, propsize_min, propsize_max, newsaleyear):
+        '''Same rows as get_filtered_table, gathered by position instead of scanning each column'''
+        view = self.current()
+        positions = view.index.positions(propname, proptype, planarea, propsize_min, propsize_max, newsaleyear)
+
+        return view.df.iloc[positions]
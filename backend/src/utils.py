@@ -1,6 +1,15 @@
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import io
+import os
+import json
+import base64
+import tempfile
+import shutil
+import time
+from contextlib import contextmanager
 from datetime import datetime
 import re
 
@@ -8,25 +17,185 @@ import re
 Server Functions
 '''
 
-def get_prop_list(csv_file="data/realis_processed.csv"):
+# Callables taking (stage name, seconds, rows or None); see timed_stage
+STAGE_OBSERVERS = []
+
+@contextmanager
+def timed_stage(name):
+    '''Times the enclosed block, or the decorated function, and reports it to every observer in
+    STAGE_OBSERVERS; set span["rows"] inside the block to report a result size. No clock is read
+    while nothing is observing'''
+    span = {}
+    if not STAGE_OBSERVERS:
+        yield span
+        return
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        seconds = time.perf_counter() - start
+        for observer in STAGE_OBSERVERS:
+            observer(name, seconds, span.get("rows"))
+
+# Compact dtypes of the processed table: categoricals for repeated strings, the narrowest numeric
+# widths that hold the REALIS value ranges, and nanosecond datetimes for the two sale dates
+SCHEMA = {
+    'Project Name': 'category',
+    'New Sale Price ($)': 'int32',
+    'New Sale Price (PSF)': 'int32',
+    'Area (SQFT)': 'float32',
+    'Address': 'category',
+    'Property Type': 'category',
+    'Tenure': 'category',
+    'Postal District': 'int8',
+    'Planning Region': 'category',
+    'Planning Area': 'category',
+    'Resale Price ($)': 'int32',
+    'Resale Price (PSF)': 'int32',
+    'Market Segment': 'category',
+    'New Sale Datetime': 'datetime64[ns]',
+    'Resale Datetime': 'datetime64[ns]',
+    'Property Age (Years)': 'float32',
+    'Price Differential (%)': 'float32',
+    'Annualized Growth': 'float32',
+}
+PROCESSED_DATETIMES = [col for col, dtype in SCHEMA.items() if dtype.startswith('datetime64')]
+PROCESSED_DTYPES = {col: dtype for col, dtype in SCHEMA.items() if col not in PROCESSED_DATETIMES}
+
+def apply_schema(df):
+    '''Casts a processed table to SCHEMA; columns already at their schema dtype are not copied'''
+    return df.astype({col: dtype for col, dtype in SCHEMA.items() if col in df.columns and df[col].dtype != dtype})
+
+@timed_stage("read_csv")
+def read_processed_table(csv_file="data/realis_processed.csv"):
+    '''Reads the processed table with typed columns and parsed datetimes'''
+    df = pd.read_csv(csv_file, dtype=PROCESSED_DTYPES, parse_dates=PROCESSED_DATETIMES)
+
+    return apply_schema(df)
+
+class ColumnarWriter:
+    '''Writes a table as one .npy file per column plus a manifest: datetimes as int64 nanoseconds,
+    strings as dictionary codes and numerics at their own width. Tables are appended piece by piece;
+    each piece is spilled to disk and close() copies them into the final columns, so memory stays
+    bounded by the largest piece'''
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.parts_dir = os.path.join(self.path, "parts")
+        os.makedirs(self.parts_dir, exist_ok=True)
+        self.columns = None
+        self.pieces = []
+        self.rows = 0
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = [{"name": col, "file": "{:02d}.npy".format(i)} for i, col in enumerate(df.columns)]
+        piece = []
+        for entry in self.columns:
+            series = df[entry["name"]]
+            if pd.api.types.is_datetime64_any_dtype(series):
+                kind, categories = "datetime", None
+                values = series.to_numpy(dtype='datetime64[ns]').view('int64')
+            elif pd.api.types.is_numeric_dtype(series):
+                kind, categories = "numeric", None
+                values = series.to_numpy()
+            else:
+                kind = "category"
+                values, categories = pd.factorize(series, sort=True)
+            entry.setdefault("kind", kind)
+            part_file = os.path.join(self.parts_dir, "{}-{}".format(len(self.pieces), entry["file"]))
+            np.save(part_file, values)
+            piece.append((part_file, values.dtype, len(values), categories))
+        self.pieces.append(piece)
+        self.rows += len(df)
+
+        return self
+
+    def close(self):
+        manifest = {"rows": self.rows, "columns": []}
+        for i, entry in enumerate(self.columns or []):
+            parts = [piece[i] for piece in self.pieces]
+            if entry["kind"] == "category":
+                categories = pd.Index([]).append([pd.Index(part[3]) for part in parts]).unique().sort_values()
+                entry["categories"] = categories.tolist()
+                dtype = np.min_scalar_type(-len(categories))
+            else:
+                dtype = np.result_type(*[part[1] for part in parts])
+            out = np.lib.format.open_memmap(os.path.join(self.path, entry["file"]), mode='w+', dtype=dtype, shape=(self.rows,))
+            start = 0
+            for part_file, _, n, part_categories in parts:
+                values = np.load(part_file)
+                if entry["kind"] == "category":
+                    # Piece-local codes to positions in the merged dictionary; missing stays -1
+                    lookup = np.append(categories.get_indexer(part_categories), -1)
+                    values = lookup[values]
+                out[start:start + n] = values
+                start += n
+                os.remove(part_file)
+            out.flush()
+            del out
+            manifest["columns"].append(entry)
+
+        os.rmdir(self.parts_dir)
+        with open(os.path.join(self.path, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+def write_columnar(df, path):
+    '''Writes a whole table as a columnar artifact; see ColumnarWriter'''
+    ColumnarWriter(path).append(df).close()
+
+@timed_stage("read_columnar")
+def read_columnar(path, mmap=True):
+    '''Loads a table written by write_columnar; with mmap the column files are mapped, not read'''
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    columns = {}
+    for entry in manifest["columns"]:
+        # asarray gives a plain ndarray view over the mapped buffer rather than an np.memmap
+        values = np.asarray(np.load(os.path.join(path, entry["file"]), mmap_mode='r' if mmap else None))
+        if entry["kind"] == "datetime":
+            values = values.view('datetime64[ns]')
+        elif entry["kind"] == "category":
+            values = pd.Categorical.from_codes(values, categories=entry["categories"])
+        columns[entry["name"]] = values
+
+    return apply_schema(pd.DataFrame(columns, copy=False))
+
+def columnar_path(csv_file):
+    '''Location of the columnar artifact written next to a processed CSV'''
+    return os.path.splitext(csv_file)[0] + ".cols"
+
+def read_dataset(path):
+    '''Reads either a columnar artifact directory or a processed CSV'''
+    if os.path.isdir(path):
+        return read_columnar(path)
+
+    return read_processed_table(path)
+
+def get_prop_list(csv_file="data/realis_processed.csv", df=None):
      '''Reads from source data and outputs list of all Project names'''
-     df = pd.read_csv(csv_file)
+     if df is None:
+          df = read_processed_table(csv_file)
      prop_list = df['Project Name'].tolist()
      prop_list = sorted(list(set(prop_list)))
 
      return prop_list
 
-def get_planarea_list(csv_file="data/realis_processed.csv"):
+def get_planarea_list(csv_file="data/realis_processed.csv", df=None):
      '''Reads from source data and outputs list of all Planning Area names'''
-     df = pd.read_csv(csv_file)
+     if df is None:
+          df = read_processed_table(csv_file)
      planarea_list = df['Planning Area'].tolist()
      planarea_list = sorted(list(set(planarea_list)))
 
      return planarea_list
 
-def get_filtered_table(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear,csv_file="data/realis_processed.csv"):
-    '''Filters the source table to user-selected parameters'''
-    df = pd.read_csv(csv_file)
+@timed_stage("get_filtered_table")
+def get_filtered_table(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear,csv_file="data/realis_processed.csv",df=None):
+    '''Filters the source table to user-selected parameters; a preloaded table passed as df is never modified'''
+    if df is None:
+        df = read_processed_table(csv_file)
     
     if propname != "All":
         df = df.loc[(df['Project Name']==propname)]
@@ -38,66 +207,77 @@ def get_filtered_table(propname,proptype,planarea,propsize_min,propsize_max,news
         df = df.loc[(df['Planning Area'].isin(planarea.split(",")))]
 
     if newsaleyear != "All":
-        df['New Sale Datetime'] = pd.to_datetime(df['New Sale Datetime'])
-        df = df.loc[(df['New Sale Datetime'].dt.year>=int(newsaleyear))]
+        df = df.loc[(pd.to_datetime(df['New Sale Datetime']).dt.year>=int(newsaleyear))]
 
-    df['Area (SQFT)'].astype(int)
     df = df.loc[(df['Area (SQFT)'].between(int(propsize_min), int(propsize_max)))]
     
     return df
 
+@timed_stage("get_stats")
 def get_stats(df):
     '''Describe statistics of the filtered table e.g. count, mean, median gain/loss'''
-    df.astype({'Price Differential (%)': 'float', 'Annualized Growth': 'float','Property Age (Years)':'float'})
-    df_stats = df[['Price Differential (%)','Annualized Growth','Property Age (Years)']].describe()
+    # Stored as float32; described in float64 so the summary keeps full precision
+    df_stats = df[['Price Differential (%)','Annualized Growth','Property Age (Years)']].astype('float64').describe()
     dict_stats = df_stats.fillna(0).to_dict()
     
     return dict_stats
 
-def get_chart_pricediff(df):
-    '''Generate PyPlot histogram of Price Differential column'''
-    df = df[["Project Name", "Area (SQFT)","Postal District","Market Segment","Property Age (Years)","Price Differential (%)"]]
-    df_visual = df.copy()
-    df_visual['Price Differential (%)'] = df_visual['Price Differential (%)'].apply(lambda x: x*100)
-    
-    
-    plt.hist(df_visual['Price Differential (%)'], color = '#b35900', edgecolor = 'black',
-            bins = int(1/0.01))
+CHART_STYLES = {
+    'pricediff': {'color': '#b35900', 'title': 'Range of Capital Gains/Losses',
+                  'xlabel': 'Gain/Loss on Sale (%)', 'ylabel': 'No. of Transactions'},
+    'anngrowth': {'color': '#007399', 'title': 'Range of Annualized Growth',
+                  'xlabel': 'Price Growth/Year (%)', 'ylabel': 'No. of Transactions'},
+}
+
+def hist_pricediff(df):
+    '''Bin counts and edges of Price Differential (%) over the data range, as charted'''
+    values = df['Price Differential (%)'].to_numpy(dtype='float64') * 100
+    edges = np.histogram_bin_edges(values, bins=int(1/0.01), range=(np.nanmin(values), np.nanmax(values)))
+    counts, _ = np.histogram(values, bins=edges)
+
+    return counts, edges
+
+def hist_anngrowth(df):
+    '''Bin counts and edges of Annualized Growth, with the upper end clamped at 100%'''
+    values = df['Annualized Growth'].to_numpy(dtype='float64') * 100
+    low, high = np.nanmin(values), np.nanmax(values)
+    edges = np.histogram_bin_edges(values, bins=int(0.5/0.005), range=(low, high if high<=100 else 100))
+    counts, _ = np.histogram(values, bins=edges)
+
+    return counts, edges
+
+@timed_stage("render_histogram")
+def render_histogram(counts, edges, style):
+    '''Draws precomputed bin counts on a private Agg figure, safe to call from several threads'''
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.hist(edges[:-1], bins=edges, weights=counts, color=style['color'], edgecolor='black')
+    ax.set_title(style['title'])
+    ax.set_xlabel(style['xlabel'])
+    ax.set_ylabel(style['ylabel'])
+
+    chart = io.BytesIO()
+    fig.savefig(chart, format='png')
+
+    return chart.getvalue()
 
-    plt.title('Range of Capital Gains/Losses')
-    plt.xlabel('Gain/Loss on Sale (%)')
-    plt.ylabel('No. of Transactions')
-
-    chart_pricediff = io.BytesIO()
-    plt.savefig(chart_pricediff, format='png')
-    plt.clf()
-    chart_pricediff.seek(0)
+def get_chart_pricediff(df):
+    '''Generate histogram PNG of Price Differential column'''
+    chart_pricediff = io.BytesIO(render_histogram(*hist_pricediff(df), CHART_STYLES['pricediff']))
 
     return chart_pricediff
 
 def get_chart_anngrowth(df):
-    '''Generate PyPlot histogram of Annualized Growth column'''
-    df = df[["Project Name", "Area (SQFT)","Postal District","Market Segment","Property Age (Years)","Annualized Growth"]]
-    df_visual = df.copy()
-    df_visual['Annualized Growth'] = df_visual['Annualized Growth'].apply(lambda x: x*100)
-
-    plt.hist(df_visual['Annualized Growth'], color = '#007399', edgecolor = 'black',
-            bins = int(0.5/0.005), range=(df_visual['Annualized Growth'].min(), df_visual['Annualized Growth'].max() if df_visual['Annualized Growth'].max()<=100 else 100))
-
-    plt.title('Range of Annualized Growth')
-    plt.xlabel('Price Growth/Year (%)')
-    plt.ylabel('No. of Transactions')
-
-    chart_anngrowth = io.BytesIO()
-    plt.savefig(chart_anngrowth, format='png')
-    plt.clf()
-    chart_anngrowth.seek(0)
+    '''Generate histogram PNG of Annualized Growth column'''
+    chart_anngrowth = io.BytesIO(render_histogram(*hist_anngrowth(df), CHART_STYLES['anngrowth']))
 
     return chart_anngrowth
 
+@timed_stage("get_performers")
 def get_performers(df):
     '''Aggregates filtered table to get (to be continued)'''
-    df = df.groupby(['Project Name','Property Type','Planning Area']).agg(
+    df = df.groupby(['Project Name','Property Type','Planning Area'], observed=True).agg(
         {
         'Project Name':['count'],
         'Annualized Growth': ['median'],
@@ -116,18 +296,78 @@ def get_performers(df):
 
     df["Median Annualized Growth (%)"] = df["Median Annualized Growth (%)"].apply(lambda x: round(x*100,1))
     df["Median Resale Price"] = df["Median Resale Price"].apply(lambda x: int(x))
-    df["Last Resale Transaction"] = df["Last Resale Transaction"].apply(lambda x: re.search(r'\b\d{4}\b', x).group())
+    if pd.api.types.is_datetime64_any_dtype(df["Last Resale Transaction"]):
+        df["Last Resale Transaction"] = df["Last Resale Transaction"].dt.year.astype(str)
+    else:
+        df["Last Resale Transaction"] = df["Last Resale Transaction"].apply(lambda x: re.search(r'\b\d{4}\b', x).group())
     df = df.sort_values(by=['Median Annualized Growth (%)'],ascending=False)
     df = df.set_index('Project Name')
 
     return df
 
+PERFORMER_FORMATS = ('columns', 'records', 'arrays')
+
+def performers_payload(df, format='columns'):
+    '''Performer table as JSON-ready data. "columns" is the to_dict() layout keyed by column then project,
+    "records" one object per project and "arrays" one list per column, project names included'''
+    df = df.fillna(0)
+    if format == 'records':
+        return df.reset_index().to_dict(orient='records')
+    if format == 'arrays':
+        return df.reset_index().to_dict(orient='list')
+
+    return df.to_dict()
+
+def assemble_report(dict_stats, chart_price, chart_growth, df_top, df_bottom, format='columns'):
+    '''Packs the stats, PNG bytes and top/bottom performer tables into the /report response'''
+    report = {
+        "stat_dict": dict_stats,
+        "chart_price": base64.b64encode(chart_price).decode() if chart_price is not None else None,
+        "chart_growth": base64.b64encode(chart_growth).decode() if chart_growth is not None else None,
+        "top_dict": performers_payload(df_top, format),
+        "bottom_dict": performers_payload(df_bottom, format),
+    }
+
+    return report
+
 '''
 Data Prep Functions
 '''
 
+RAW_COLUMNS = [
+    'Project Name',
+    'Transacted Price ($)',
+    'Area (SQFT)',
+    'Unit Price ($ PSF)',
+    'Sale Date',
+    'Address',
+    'Type of Sale',
+    'Type of Area',
+    'Property Type',
+    'Tenure',
+    'Postal District',
+    'Planning Region',
+    'Planning Area'
+]
+# Column order of the raw state files, whatever order the export used
+STATE_COLUMNS = RAW_COLUMNS + ['project_address']
+RESALE_COLUMNS = ["Transacted Price ($)", "Unit Price ($ PSF)", "Sale Date","project_address"]
+
 def clean_table(df):
     df = df.replace(',','', regex=True)
+
+    return prepare_strata(df)
+
+def clean_chunk(df):
+    '''clean_table for one chunk of the raw export; only columns read as text are stripped of commas'''
+    for col in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].str.replace(',', '', regex=False)
+
+    return prepare_strata(df)
+
+def prepare_strata(df):
+    '''Types the price and area columns and keeps strata units keyed by project and address'''
     df = df.astype({'Transacted Price ($)': 'int64',
                     'Area (SQFT)': 'float64',
                     'Unit Price ($ PSF)': 'int64'
@@ -162,11 +402,66 @@ def match_newsale_resale(df):
     
     return df_combine
 
-def assign_mktsegment(df):
-    CCR = [9,10,11,1,2,6]
-    RCR = [3,4,5,7,8,12,13,14,15,20]
-    OCR = [16,17,18,19,21,22,23,24,25,26,27,28]
+CCR = [9,10,11,1,2,6]
+RCR = [3,4,5,7,8,12,13,14,15,20]
+OCR = [16,17,18,19,21,22,23,24,25,26,27,28]
+
+PROCESSED_COLUMNS = [
+    'Project Name',
+    'New Sale Price ($)',
+    'New Sale Price (PSF)',
+    'Area (SQFT)',
+    'Address',
+    'Property Type',
+    'Tenure',
+    'Postal District',
+    'Planning Region',
+    'Planning Area',
+    'Resale Price ($)',
+    'Resale Price (PSF)',
+    'Market Segment',
+    'New Sale Datetime',
+    'Resale Datetime',
+    'Property Age (Years)',
+    'Price Differential (%)',
+    'Annualized Growth'
+]
+
+def match_newsale_resale_sorted(df):
+    '''Same pairs as match_newsale_resale followed by the date filter in convert_datetimes, found by
+    factorizing project_address to integers and binary-searching resales sorted by (key, date)'''
+    df_newsale = df.loc[df['Type of Sale'] == 'New Sale'].drop(columns=['Type of Sale'])
+    df_resale = df.loc[df['Type of Sale'].isin(['Resale']), RESALE_COLUMNS]
+
+    codes, _ = pd.factorize(pd.concat([df_newsale['project_address'], df_resale['project_address']]), use_na_sentinel=False)
+    new_code, re_code = codes[:len(df_newsale)].astype('int64'), codes[len(df_newsale):].astype('int64')
+    new_day = pd.to_datetime(df_newsale['Sale Date'], format='%d/%m/%Y').to_numpy(dtype='datetime64[D]').astype('int64')
+    re_day = pd.to_datetime(df_resale['Sale Date'], format='%d/%m/%Y').to_numpy(dtype='datetime64[D]').astype('int64')
+
+    # One sortable int64 per row: key in the high 32 bits, day number in the low 32 bits
+    re_composite = (re_code << 32) | (re_day + 2**31)
+    order = np.argsort(re_composite, kind='stable')
+    re_sorted = re_composite[order]
+    start = np.searchsorted(re_sorted, (new_code << 32) | (new_day + 2**31), side='right')
+    stop = np.searchsorted(re_sorted, (new_code + 1) << 32, side='left')
+
+    counts = stop - start
+    new_idx = np.repeat(np.arange(len(df_newsale)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    re_idx = order[np.repeat(start, counts) + offsets]
+
+    df_left = df_newsale.drop(columns=['project_address']).iloc[new_idx].reset_index(drop=True)
+    df_right = df_resale.drop(columns=['project_address']).iloc[re_idx].reset_index(drop=True)
+    df_left = df_left.rename(columns={'Transacted Price ($)': 'New Sale Price ($)',
+                                      'Unit Price ($ PSF)': 'New Sale Price (PSF)',
+                                      'Sale Date': 'New Sale Date'})
+    df_right = df_right.rename(columns={'Transacted Price ($)': 'Resale Price ($)',
+                                        'Unit Price ($ PSF)': 'Resale Price (PSF)',
+                                        'Sale Date': 'Resale Date'})
+
+    return pd.concat([df_left, df_right], axis=1)
 
+def assign_mktsegment(df):
     def segment(x):
         if x in CCR:
             return 'CCR'
@@ -210,4 +505,198 @@ def add_metrics_cols(df):
                                                         ((1+row['Price Differential (%)'])**(1/row['Property Age (Years)']))-1
                                                         , axis = 1)
     
-    return df            
\ No newline at end of file
+    return df
+
+def assign_mktsegment_vectorized(df):
+    '''Same as assign_mktsegment, using a district to segment lookup array'''
+    lookup = np.full(max(CCR + RCR + OCR) + 1, 'Null', dtype=object)
+    for name, districts in (('CCR', CCR), ('RCR', RCR), ('OCR', OCR)):
+        lookup[districts] = name
+
+    district = pd.to_numeric(df['Postal District'], errors='coerce').to_numpy(dtype='float64')
+    valid = (district >= 0) & (district < len(lookup)) & (district == np.floor(district))
+    segment = np.full(len(df), 'Null', dtype=object)
+    segment[valid] = lookup[district[valid].astype(int)]
+    df['Market Segment'] = segment
+
+    return df
+
+def convert_datetimes_vectorized(df):
+    '''Same as convert_datetimes, parsing whole columns with an explicit format'''
+    df['New Sale Datetime'] = pd.to_datetime(df['New Sale Date'], format='%d/%m/%Y')
+    df['Resale Datetime'] = pd.to_datetime(df['Resale Date'], format='%d/%m/%Y')
+    df = df.drop(columns=['New Sale Date','Resale Date'])
+    df = df.loc[df['New Sale Datetime'] < df['Resale Datetime']]
+
+    return df
+
+def add_metrics_cols_vectorized(df):
+    '''Same as add_metrics_cols, computed with column-wise arithmetic'''
+    days = (df['Resale Datetime'] - df['New Sale Datetime']).dt.days
+    df['Property Age (Years)'] = (days / 365).round(1)
+    df['Price Differential (%)'] = (df['Resale Price (PSF)'] - df['New Sale Price (PSF)']) / df['New Sale Price (PSF)']
+    df['Annualized Growth'] = ((1 + df['Price Differential (%)']) ** (1 / df['Property Age (Years)'])) - 1
+
+    return df
+
+PIPELINES = {
+    'rowwise': [clean_table, match_newsale_resale, assign_mktsegment, convert_datetimes, add_metrics_cols],
+    'vectorized': [clean_table, match_newsale_resale_sorted, assign_mktsegment_vectorized, convert_datetimes_vectorized, add_metrics_cols_vectorized],
+}
+
+def process_table(df, mode='vectorized', cleaned=False):
+    '''Runs a raw REALIS export through every data prep stage and keeps the processed columns'''
+    stages = PIPELINES[mode][1:] if cleaned else PIPELINES[mode]
+    for stage in stages:
+        with timed_stage(stage.__name__):
+            df = stage(df)
+
+    return df[PROCESSED_COLUMNS]
+
+def partition_of(keys, n_partitions):
+    '''Stable partition number of each project address key'''
+    return pd.util.hash_array(np.asarray(keys, dtype=object)) % n_partitions
+
+def new_rows(df_existing, df_delta):
+    '''Rows of df_delta not already in df_existing, counting repeats: a row delivered again is dropped,
+    but a batch holding a row once more than the history keeps that copy, as a full rebuild would'''
+    cols = list(df_delta.columns)
+    # Compared as text, so a column parsed with another dtype on one side still matches
+    existing, delta = df_existing[cols].astype(str), df_delta[cols].astype(str)
+    existing['_repeat'] = existing.groupby(cols).cumcount()
+    delta['_repeat'] = delta.groupby(cols).cumcount()
+    merged = delta.merge(existing, on=cols + ['_repeat'], how='left', indicator=True)
+
+    return df_delta.loc[(merged['_merge'] == 'left_only').to_numpy()]
+
+def ingest_increment(df_state, df_processed, df_delta, mode='vectorized', cleaned=False):
+    '''Adds a batch of new raw rows, re-matching only the project addresses that appear in the batch.
+    df_state is the cleaned history, or at least every row of the batch's addresses. Returns the batch
+    rows to append to that history and the updated processed table'''
+    if not cleaned:
+        df_delta = clean_table(df_delta)
+
+    keys = df_delta['project_address'].unique()
+    df_affected = df_state.loc[df_state['project_address'].isin(keys)]
+    df_added = new_rows(df_affected, df_delta)
+    df_matched = process_table(pd.concat([df_affected, df_added], ignore_index=True), mode, cleaned=True)
+
+    processed_keys = df_processed['Project Name'].astype(str) + df_processed['Address'].astype(str)
+    df_processed = pd.concat([df_processed.loc[~processed_keys.isin(keys)], df_matched], ignore_index=True)
+
+    return df_added, df_processed
+
+def state_paths(state_dir, part):
+    '''Cleaned raw rows and processed columnar artifact of one state partition'''
+    return (os.path.join(state_dir, "raw-{:03d}.csv".format(part)),
+            os.path.join(state_dir, "processed-{:03d}.cols".format(part)))
+
+def write_state(state_dir, df_state, df_processed, n_partitions=64):
+    '''Splits the cleaned history and the processed table into partitions by project address, the
+    layout ingest_state updates one partition at a time'''
+    os.makedirs(state_dir, exist_ok=True)
+    raw_parts = partition_of(df_state['project_address'], n_partitions)
+    processed_parts = partition_of(df_processed['Project Name'].astype(str) + df_processed['Address'].astype(str), n_partitions)
+    for part in range(n_partitions):
+        raw_csv, processed_cols = state_paths(state_dir, part)
+        df_state.loc[raw_parts == part, STATE_COLUMNS].to_csv(raw_csv, index=False)
+        write_columnar(df_processed.loc[processed_parts == part].reset_index(drop=True), processed_cols)
+    with open(os.path.join(state_dir, "manifest.json"), "w") as f:
+        json.dump({"partitions": n_partitions}, f)
+
+def swap_directory(staging, path):
+    '''Moves a freshly written directory into place; readers still mapping the old files keep their pages'''
+    if os.path.isdir(path):
+        retired = path + ".old{}".format(os.getpid())
+        os.rename(path, retired)
+        os.rename(staging, path)
+        shutil.rmtree(retired)
+    else:
+        os.rename(staging, path)
+
+def ingest_state(state_dir, df_delta, columnar, mode='vectorized'):
+    '''Upserts a raw batch into a partitioned state written by write_state or process_chunked. Only the
+    partitions holding the batch's addresses are read: their new raw rows are appended and their
+    processed rows rewritten. The served columnar artifact is then reassembled from the partition
+    artifacts without re-parsing any history, and its prebuilt structures saved alongside; that copy still
+    reads and writes every served row, so it is skipped when the batch adds nothing. Returns the number
+    of raw rows added'''
+    with open(os.path.join(state_dir, "manifest.json")) as f:
+        n_partitions = json.load(f)["partitions"]
+
+    df_delta = clean_table(df_delta)[STATE_COLUMNS]
+    n_added = 0
+    for part, df_part in df_delta.groupby(partition_of(df_delta['project_address'], n_partitions)):
+        raw_csv, processed_cols = state_paths(state_dir, part)
+        df_state = pd.read_csv(raw_csv, usecols=STATE_COLUMNS)[STATE_COLUMNS]
+        df_added, df_processed = ingest_increment(df_state, read_columnar(processed_cols, mmap=False), df_part, mode, cleaned=True)
+        if len(df_added) == 0:
+            continue
+        df_added.to_csv(raw_csv, mode='a', header=False, index=False)
+        write_columnar(apply_schema(df_processed), processed_cols + ".tmp")
+        swap_directory(processed_cols + ".tmp", processed_cols)
+        n_added += len(df_added)
+
+    if n_added or not os.path.isdir(columnar):
+        writer = ColumnarWriter(str(columnar) + ".tmp")
+        for part in range(n_partitions):
+            writer.append(read_columnar(state_paths(state_dir, part)[1]))
+        writer.close()
+        # Imported here, as the store's structures are built on top of this module
+        from .store import publish_structures
+        publish_structures(str(columnar) + ".tmp")
+        swap_directory(str(columnar) + ".tmp", str(columnar))
+
+    return n_added
+
+def process_chunked(raw_csv, output_csv, chunksize=100000, n_partitions=64, mode='vectorized', state_dir=None, spill_dir=None, columnar=None):
+    '''Streams the raw export in chunks and spills new sales and resales to disk partitioned by
+    project address, so only one partition is ever matched in memory. Each processed partition is
+    appended to the CSV and, when paths are given, to the columnar artifact and to the partitioned
+    state used by ingest_state. Returns the rows written'''
+    writer = ColumnarWriter(columnar) if columnar is not None else None
+    if state_dir is not None:
+        os.makedirs(state_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=spill_dir) as tmp:
+        spill = lambda kind, part: os.path.join(tmp, "{}-{}.csv".format(kind, part))
+
+        for chunk in pd.read_csv(raw_csv, usecols=RAW_COLUMNS, chunksize=chunksize):
+            chunk = clean_chunk(chunk)
+            partition = partition_of(chunk['project_address'], n_partitions)
+            for part, df_part in chunk.groupby(partition):
+                if state_dir is not None:
+                    raw_state = state_paths(state_dir, part)[0]
+                    df_part[STATE_COLUMNS].to_csv(raw_state, mode='a', header=not os.path.exists(raw_state), index=False)
+                for kind, df_kind in (('newsale', df_part.loc[df_part['Type of Sale'] == 'New Sale']),
+                                      ('resale', df_part.loc[df_part['Type of Sale'] == 'Resale', RESALE_COLUMNS])):
+                    if len(df_kind):
+                        path = spill(kind, part)
+                        df_kind.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+        n_rows = 0
+        empty = apply_schema(pd.DataFrame(columns=PROCESSED_COLUMNS))
+        empty.to_csv(output_csv, index=False)
+        for part in range(n_partitions):
+            df = empty
+            if os.path.exists(spill('newsale', part)) and os.path.exists(spill('resale', part)):
+                df_resale = pd.read_csv(spill('resale', part))
+                df_resale['Type of Sale'] = 'Resale'
+                df = pd.concat([pd.read_csv(spill('newsale', part)), df_resale], ignore_index=True)
+                df = apply_schema(process_table(df, mode, cleaned=True))
+                df.to_csv(output_csv, mode='a', header=False, index=False)
+                if writer is not None:
+                    writer.append(df)
+                n_rows += len(df)
+            if state_dir is not None:
+                raw_state, processed_state = state_paths(state_dir, part)
+                if not os.path.exists(raw_state):
+                    pd.DataFrame(columns=STATE_COLUMNS).to_csv(raw_state, index=False)
+                write_columnar(df.reset_index(drop=True), processed_state)
+
+    if writer is not None:
+        writer.close()
+    if state_dir is not None:
+        with open(os.path.join(state_dir, "manifest.json"), "w") as f:
+            json.dump({"partitions": n_partitions}, f)
+
+    return n_rows
@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from .utils import get_prop_list, get_planarea_list, get_stats, timed_stage
+from .store import DatasetStore, file_fingerprint
+from .cache import ResultCache
+from .cube import grid_histogram
+
+'''
+Query Workers
+'''
+
+class Overloaded(Exception):
+    '''Raised instead of queueing once the worker pool already holds max_pending tasks'''
+
+# Dataset held by this worker: loaded by the process initializer, or the server's own store in thread mode
+_store = None
+_positions = ResultCache(max_entries=64)
+
+def use_store(store):
+    global _store
+    _store = store
+
+def clear_positions():
+    '''Forgets the cached filter results of this process'''
+    _positions.clear()
+
+def load_store(path):
+    use_store(DatasetStore(path).load())
+
+def worker_view(version):
+    '''The worker's dataset, re-read first if the server has moved on to a newer file'''
+    if _store.version != version and file_fingerprint(_store.path) != _store.version:
+        _store.reload()
+
+    return _store.current()
+
+def matching_positions(view, query):
+    with timed_stage("filter") as span:
+        positions = _positions.get_or_compute(view.version, query, "positions", lambda: view.index.positions(*query))
+        span["rows"] = len(positions)
+        return positions
+
+def filtered_rows(view, query):
+    return view.df.iloc[matching_positions(view, query)]
+
+def lists_task(version):
+    view = worker_view(version)
+    return get_prop_list(df=view.df), get_planarea_list(df=view.df)
+
+def stats_task(version, query, mode, exact_max_rows):
+    '''(stat_dict, rank_error) for a query. "approx" merges the per-cell sketches, "exact" runs get_stats
+    on the rows, and "auto" only approximates above exact_max_rows; rank_error is None when exact'''
+    view = worker_view(version)
+    mask = view.cube.cell_mask(*query) if mode != "exact" else None
+    if mask is not None and (mode == "approx" or view.sketch.count(mask) > exact_max_rows):
+        with timed_stage("approx_stats"):
+            return view.sketch.describe(mask)
+
+    return get_stats(filtered_rows(view, query)), None
+
+def performers_task(version, query, n):
+    '''(top, bottom) performer tables from one partial-selection pass over the project aggregates'''
+    view = worker_view(version)
+    with timed_stage("top_bottom"):
+        return view.performers.top_bottom(view.df, view.index, query, n)
+
+def positions_task(version, query):
+    '''Ascending row positions matching a query, for exporting the rows themselves'''
+    return matching_positions(worker_view(version), query)
+
+def histogram_task(version, query, name):
+    '''Fixed-grid bin counts from the histogram cube; rows are only read when the area bounds are off its buckets'''
+    view = worker_view(version)
+    with timed_stage("histogram_cube"):
+        counts = view.cube.histogram(name, *query)
+
+    return counts if counts is not None else grid_histogram(filtered_rows(view, query), name)
+
+class WorkerPool:
+    '''Bounded pool running the CPU-bound query steps off the event loop. With processes=True every
+    worker holds its own preloaded copy of the dataset; otherwise threads share the server's store.
+    Tasks beyond max_pending (running plus queued) are rejected with Overloaded'''
+
+    def __init__(self, max_workers=4, max_pending=64, processes=False):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.processes = processes
+        self.pool = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def start(self, store):
+        '''Creates the pool; process workers load the dataset up front rather than on their first task'''
+        if self.pool is not None:
+            return self
+        # The server's own store backs tasks run outside the pool, e.g. while a request is profiled
+        use_store(store)
+        if self.processes:
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=load_store, initargs=(store.path,))
+            for future in [self.pool.submit(worker_view, store.version) for _ in range(self.max_workers)]:
+                future.result()
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        return self
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self.pool is None:
+                raise RuntimeError("Worker pool has not been started")
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded("{} tasks already pending".format(self.pending))
+            self.pending += 1
+        try:
+            future = self.pool.submit(fn, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+            if future is not None:
+                self.completed += 1
+
+    async def run(self, fn, *args):
+        '''Awaits fn(*args) on the pool without blocking the event loop'''
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self):
+        return {"workers": self.max_workers, "processes": self.processes, "pending": self.pending,
+                "max_pending": self.max_pending, "completed": self.completed, "rejected": self.rejected}
+
+    def shutdown(self):
+        with self._lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,249 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from benchmarks.synthetic import write_realis
+from src.utils import RAW_COLUMNS, apply_schema, process_table, read_dataset
+
+'''
+HTTP Load Test
+'''
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+DEFAULT_MIX = "stats=3,chartprice=2,chartgrowth=2,performerstop=1,performersbottom=1,report=2,histograms=1"
+CHART_ENDPOINTS = ('chartprice', 'chartgrowth')
+
+def parse_mix(mix):
+    '''"stats=3,report=1" -> (['stats', 'report'], [0.75, 0.25])'''
+    weights = dict(part.split("=") for part in mix.split(","))
+    total = sum(float(weight) for weight in weights.values())
+
+    return list(weights), [float(weight) / total for weight in weights.values()]
+
+def sample_queries(df, n, rng):
+    '''n random filters over the dataset's own projects, planning areas, years and size ranges'''
+    projects = df['Project Name'].value_counts().index[:200].astype(str)
+    areas = df['Planning Area'].dropna().unique().astype(str)
+    years = ['All'] + [str(year) for year in range(2000, 2016)]
+    queries = []
+    for _ in range(n):
+        low = int(rng.choice([100, 200, 500, 650, 800, 1000]))
+        query = {"propname": "All", "proptype": "All", "planarea": "All", "propsize_min": low,
+                 "propsize_max": int(low + rng.choice([500, 1000, 1450, 2000, 7000])), "newsaleyear": str(rng.choice(years))}
+        kind = rng.random()
+        if kind < 0.2:
+            query["propname"] = str(rng.choice(projects))
+        elif kind < 0.7:
+            query["planarea"] = ",".join(rng.choice(areas, size=rng.integers(1, 4), replace=False))
+            query["proptype"] = str(rng.choice(['All', 'Condominium', 'Executive Condominium']))
+        queries.append(query)
+
+    return queries
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(data_file, port, workers, env_overrides, timeout=120):
+    '''Launches server.py on its own port and waits until it answers'''
+    env = {**os.environ, "PROPALANTIR_DATA_FILE": os.path.abspath(data_file), **env_overrides}
+    process = subprocess.Popen([sys.executable, "server.py", "--port", str(port), "--workers", str(workers)],
+                               cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("server exited with code {}".format(process.returncode))
+        try:
+            requests.get("http://127.0.0.1:{}/".format(port), timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("server did not start within {}s".format(timeout))
+
+def digest(content):
+    return hashlib.sha1(content).hexdigest()
+
+class LoadRecorder:
+    '''Per-endpoint latencies and status codes, plus chart digests that differ from the reference;
+    charts are not checked when reference is None'''
+
+    def __init__(self, reference):
+        self.reference = reference
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.chart_mismatches = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, query_no, seconds, status, content):
+        mismatch = (self.reference is not None and status == 200 and endpoint in CHART_ENDPOINTS
+                    and self.reference.get((endpoint, query_no)) != digest(content))
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[endpoint][status] += 1
+            if mismatch:
+                self.chart_mismatches[endpoint] += 1
+
+    def summary(self, elapsed):
+        report = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            ms = np.asarray(latencies) * 1000
+            statuses = dict(self.statuses[endpoint])
+            errors = sum(count for status, count in statuses.items() if not 200 <= status < 300)
+            report[endpoint] = {
+                "requests": len(ms),
+                "throughput_rps": len(ms) / elapsed,
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "p99_ms": float(np.percentile(ms, 99)),
+                "max_ms": float(ms.max()),
+                "error_rate": errors / len(ms),
+                "statuses": {str(status): count for status, count in statuses.items()},
+            }
+            if endpoint in CHART_ENDPOINTS and self.reference is not None:
+                report[endpoint]["chart_mismatches"] = self.chart_mismatches[endpoint]
+
+        return report
+
+def fetch(session, base_url, endpoint, query):
+    '''(status, body); connection failures are reported as status 0'''
+    try:
+        response = session.get("{}/{}".format(base_url, endpoint), params=query, timeout=60)
+        return response.status_code, response.content
+    except requests.RequestException:
+        return 0, b""
+
+def reference_charts(base_url, queries):
+    '''Chart digests fetched one at a time before any load is applied'''
+    session = requests.Session()
+    reference = {}
+    for endpoint in CHART_ENDPOINTS:
+        for query_no, query in enumerate(queries):
+            status, content = fetch(session, base_url, endpoint, query)
+            if status == 200:
+                reference[(endpoint, query_no)] = digest(content)
+
+    return reference
+
+def run_load(base_url, queries, mix, concurrency, rate, duration, recorder, seed):
+    '''Closed loop with `concurrency` clients when rate is None, otherwise an open loop sending `rate`
+    requests per second; open-loop latency counts from each request's scheduled send time'''
+    endpoints, weights = parse_mix(mix)
+    rng = np.random.default_rng(seed)
+    stop_at = time.monotonic() + duration
+    local = threading.local()
+
+    def one_request(endpoint, query_no, scheduled=None):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter() if scheduled is None else scheduled
+        status, content = fetch(local.session, base_url, endpoint, queries[query_no])
+        recorder.record(endpoint, query_no, time.perf_counter() - start, status, content)
+
+    def plan(n):
+        return zip(rng.choice(endpoints, p=weights, size=n).tolist(), rng.integers(len(queries), size=n).tolist())
+
+    start = time.monotonic()
+    if rate is None:
+        def client(worker_seed):
+            client_rng = np.random.default_rng([seed, worker_seed])
+            while time.monotonic() < stop_at:
+                one_request(str(client_rng.choice(endpoints, p=weights)), int(client_rng.integers(len(queries))))
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(client, range(concurrency)))
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            perf_start = time.perf_counter()
+            for i, (endpoint, query_no) in enumerate(plan(int(rate * duration))):
+                scheduled = perf_start + i / rate
+                time.sleep(max(0, scheduled - time.perf_counter()))
+                pool.submit(one_request, endpoint, query_no, scheduled)
+
+    return time.monotonic() - start
+
+def prepare_data(args):
+    '''The processed dataset to serve: --data as given, or a synthetic export of --rows run through the pipeline'''
+    if args.data:
+        return args.data
+    os.makedirs(args.data_dir, exist_ok=True)
+    processed = os.path.join(args.data_dir, "realis_{}_seed{}_processed.csv".format(args.rows, args.seed))
+    if not os.path.exists(processed):
+        raw = os.path.join(args.data_dir, "realis_{}_seed{}.csv".format(args.rows, args.seed))
+        if not os.path.exists(raw):
+            write_realis(raw, args.rows, args.seed)
+        apply_schema(process_table(pd.read_csv(raw, usecols=RAW_COLUMNS))).to_csv(processed, index=False)
+
+    return processed
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays a mix of filter queries against a locally started backend')
+    parser.add_argument('--data', help='processed CSV or columnar artifact to serve')
+    parser.add_argument('--rows', type=int, default=100000, help='synthetic export size when --data is not given')
+    parser.add_argument('--data-dir', default='benchmarks/data')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='endpoint=weight pairs')
+    parser.add_argument('--queries', type=int, default=50, help='distinct filters sampled from the data')
+    parser.add_argument('--concurrency', type=int, default=16, help='clients in closed-loop mode, max in-flight requests with --rate')
+    parser.add_argument('--rate', type=float, help='target requests per second (open loop)')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--server-cache', action='store_true',
+                        help='keep the result and chart caches on; charts are then not compared, as every '
+                             'one under load would be the cached copy of its reference')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmarks/load_results.json')
+    args = parser.parse_args()
+
+    data_file = prepare_data(args)
+    queries = sample_queries(read_dataset(data_file), args.queries, np.random.default_rng(args.seed))
+    # With the caches off every chart under load is rendered again, so comparing it to the reference means something
+    env = {} if args.server_cache else {"PROPALANTIR_CACHE_ENTRIES": "0", "PROPALANTIR_CHART_CACHE_ENTRIES": "0"}
+    port = free_port()
+    base_url = "http://127.0.0.1:{}".format(port)
+
+    server = start_server(data_file, port, args.workers, env)
+    try:
+        recorder = LoadRecorder(None if args.server_cache else reference_charts(base_url, queries))
+        elapsed = run_load(base_url, queries, args.mix, args.concurrency, args.rate, args.duration, recorder, args.seed)
+    finally:
+        server.terminate()
+        server.wait()
+
+    endpoints = recorder.summary(elapsed)
+    total = sum(stats["requests"] for stats in endpoints.values())
+    report = {
+        "config": {key: value for key, value in vars(args).items()},
+        "elapsed_seconds": elapsed,
+        "throughput_rps": total / elapsed,
+        "chart_mismatches": None if args.server_cache else sum(stats.get("chart_mismatches", 0) for stats in endpoints.values()),
+        "endpoints": endpoints,
+    }
+
+    print("{:<18}{:>9}{:>9}{:>9}{:>9}{:>9}{:>8}".format("endpoint", "req", "rps", "p50 ms", "p95 ms", "p99 ms", "err %"))
+    for endpoint, stats in endpoints.items():
+        print("{:<18}{:>9}{:>9.1f}{:>9.1f}{:>9.1f}{:>9.1f}{:>8.2f}".format(
+            endpoint, stats["requests"], stats["throughput_rps"], stats["p50_ms"], stats["p95_ms"], stats["p99_ms"], 100 * stats["error_rate"]))
+    print("total {:.1f} req/s, chart bytes differing from single-threaded output: {}".format(
+        report["throughput_rps"], "not checked with --server-cache" if args.server_cache else report["chart_mismatches"]))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    return 1 if report["chart_mismatches"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from benchmarks.synthetic import write_realis
+from src.utils import PIPELINES, RAW_COLUMNS, PROCESSED_COLUMNS, apply_schema
+from src.store import DatasetStore
+
+'''
+Pipeline and Endpoint Benchmarks
+'''
+
+SIZES = {'100k': 100000, '1m': 1000000, '10m': 10000000}
+ENDPOINTS = ['/propnames', '/planningareas', '/stats', '/chartprice', '/chartgrowth',
+             '/performerstop', '/performersbottom', '/report', '/histograms']
+BASE_QUERY = {"propname": "All", "proptype": "All", "planarea": "All", "propsize_min": 200, "propsize_max": 2000, "newsaleyear": "All"}
+
+def measure(fn, *args, trace=True):
+    '''(result, seconds, peak bytes allocated above the starting point) of one call'''
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    seconds = time.perf_counter() - start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result, seconds, peak
+
+def query_mix(df):
+    '''Representative filters: everything, one busy planning area, one project, a year cut and
+    area bounds off the 100 sqft buckets so the cube falls back to the rows'''
+    top_area = df['Planning Area'].value_counts().index[0]
+    top_project = df['Project Name'].value_counts().index[0]
+
+    return {
+        "all": BASE_QUERY,
+        "planarea": {**BASE_QUERY, "planarea": str(top_area)},
+        "project": {**BASE_QUERY, "propname": str(top_project), "propsize_min": 100, "propsize_max": 8000},
+        "year": {**BASE_QUERY, "newsaleyear": "2010"},
+        "unaligned": {**BASE_QUERY, "proptype": "Condominium", "propsize_min": 650, "propsize_max": 1450},
+    }
+
+def bench_pipeline(raw_csv, mode, trace):
+    '''Times reading the raw export and each data prep stage of the chosen pipeline'''
+    results = {}
+    df, seconds, peak = measure(lambda: pd.read_csv(raw_csv, usecols=RAW_COLUMNS), trace=trace)
+    results['read_csv'] = {'seconds': seconds, 'peak_bytes': peak, 'rows_out': len(df)}
+    for stage in PIPELINES[mode]:
+        df, seconds, peak = measure(stage, df, trace=trace)
+        results[stage.__name__] = {'seconds': seconds, 'peak_bytes': peak, 'rows_out': len(df)}
+
+    return apply_schema(df[PROCESSED_COLUMNS].reset_index(drop=True)), results
+
+def bench_handlers(processed_csv, queries, repeats):
+    '''Times every endpoint in-process through the ASGI app, cold (result, chart and filter caches all
+    empty) and warm'''
+    import server
+    from fastapi.testclient import TestClient
+    from src.workers import clear_positions
+
+    def empty_caches():
+        server.cache.clear()
+        server.renderer.clear()
+        clear_positions()
+
+    server.store = DatasetStore(processed_csv)
+    _, load_seconds, _ = measure(server.store.load, trace=False)
+    results = {'store_load': {'seconds': load_seconds}}
+    with TestClient(server.app) as client:
+        for endpoint in ENDPOINTS:
+            for name, params in queries.items():
+                empty_caches()
+                call = lambda: client.get(endpoint, params=params).raise_for_status()
+                _, cold, _ = measure(call, trace=False)
+                warm = [measure(call, trace=False)[1] for _ in range(repeats)]
+                results["{} {}".format(endpoint, name)] = {'cold_seconds': cold, 'warm_seconds': statistics.median(warm)}
+                if endpoint in ('/propnames', '/planningareas'):
+                    break
+
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the data prep pipeline and every endpoint on synthetic REALIS exports')
+    parser.add_argument('--sizes', nargs='+', default=['100k'], help='any of {} or a row count'.format(', '.join(SIZES)))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mode', choices=list(PIPELINES), default='vectorized')
+    parser.add_argument('--data-dir', default='benchmarks/data', help='generated exports are kept here and reused')
+    parser.add_argument('--output', default='benchmarks/results.json')
+    parser.add_argument('--repeats', type=int, default=5, help='warm calls per endpoint and query')
+    parser.add_argument('--no-tracemalloc', action='store_true', help='skip peak memory tracing, which slows the stages down')
+    parser.add_argument('--skip-handlers', action='store_true')
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'mode': args.mode,
+        'seed': args.seed,
+        'runs': [],
+    }
+    for size in args.sizes:
+        n_rows = SIZES.get(size.lower()) or int(size)
+        raw_csv = os.path.join(args.data_dir, 'realis_{}_seed{}.csv'.format(n_rows, args.seed))
+        if not os.path.exists(raw_csv):
+            print('generating {:,} rows -> {}'.format(n_rows, raw_csv))
+            write_realis(raw_csv, n_rows, args.seed)
+
+        df, stages = bench_pipeline(raw_csv, args.mode, not args.no_tracemalloc)
+        run = {'rows': n_rows, 'processed_rows': len(df), 'stages': stages}
+        print('{:>10,} rows  '.format(n_rows) + '  '.join('{} {:.2f}s'.format(name, stage['seconds']) for name, stage in stages.items()))
+
+        if not args.skip_handlers:
+            processed_csv = os.path.join(args.data_dir, 'realis_{}_seed{}_processed.csv'.format(n_rows, args.seed))
+            df.to_csv(processed_csv, index=False)
+            run['handlers'] = bench_handlers(processed_csv, query_mix(df), args.repeats)
+            slowest = max(run['handlers'].items(), key=lambda item: item[1].get('cold_seconds', 0))
+            print('{:>10,} rows  slowest cold handler: {} {:.3f}s'.format(n_rows, slowest[0], slowest[1]['cold_seconds']))
+
+        # ru_maxrss is in KiB on Linux
+        run['max_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        report['runs'].append(run)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print('results written to {}'.format(args.output))
+
+if __name__ == "__main__":
+    main()
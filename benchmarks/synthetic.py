@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+'''
+Synthetic REALIS Export
+'''
+
+# (planning region, planning area, postal district) triples used for synthetic projects
+PLANNING_AREAS = [
+    ('Central Region', 'Downtown Core', 1), ('Central Region', 'Bukit Merah', 3), ('Central Region', 'Queenstown', 3),
+    ('Central Region', 'Orchard', 9), ('Central Region', 'River Valley', 9), ('Central Region', 'Bukit Timah', 10),
+    ('Central Region', 'Tanglin', 10), ('Central Region', 'Novena', 11), ('Central Region', 'Kallang', 12),
+    ('Central Region', 'Toa Payoh', 12), ('Central Region', 'Geylang', 14), ('Central Region', 'Marine Parade', 15),
+    ('East Region', 'Bedok', 16), ('East Region', 'Tampines', 18), ('East Region', 'Pasir Ris', 18),
+    ('North East Region', 'Hougang', 19), ('North East Region', 'Sengkang', 19), ('North East Region', 'Punggol', 19),
+    ('North East Region', 'Serangoon', 19), ('North East Region', 'Ang Mo Kio', 20),
+    ('West Region', 'Clementi', 5), ('West Region', 'Jurong East', 22), ('West Region', 'Jurong West', 22),
+    ('West Region', 'Bukit Batok', 23), ('West Region', 'Bukit Panjang', 23), ('West Region', 'Choa Chu Kang', 23),
+    ('North Region', 'Woodlands', 25), ('North Region', 'Sembawang', 27), ('North Region', 'Yishun', 27),
+]
+REGION_PSF = {'Central Region': 1600, 'East Region': 1000, 'North East Region': 950, 'West Region': 900, 'North Region': 800}
+PROPERTY_TYPES = (['Apartment', 'Condominium', 'Executive Condominium'], [0.45, 0.45, 0.10])
+NAME_WORDS = (['SAIL', 'INTERLACE', 'MINTON', 'RIVERVALE', 'TREASURE', 'WATERFRONT', 'NORTHPARK', 'REFLECTIONS',
+               'CASCADIA', 'BELLEWATERS', 'PARC', 'SKY', 'LAKE', 'HILL', 'GARDEN', 'PALM', 'CORAL', 'JADE',
+               'EMERALD', 'AMBER', 'OASIS', 'VISTA', 'HAVEN', 'GROVE', 'CREST', 'BAY', 'PEAK', 'MEADOW'],
+              ['RESIDENCES', 'SUITES', 'GARDENS', 'HEIGHTS', 'VIEW', 'COURT', 'POINT', 'LODGE', 'TOWERS', 'PARK'])
+RAW_HEADER = ['Project Name', 'Transacted Price ($)', 'Area (SQFT)', 'Unit Price ($ PSF)', 'Sale Date', 'Address',
+              'Type of Sale', 'Type of Area', 'Property Type', 'Tenure', 'Postal District', 'Planning Region', 'Planning Area']
+FIRST_DAY, LAST_DAY = np.datetime64('1995-01-01'), np.datetime64('2022-12-31')
+MEAN_RESALES = 1.2
+UNITS_PER_PROJECT = 500
+
+def make_projects(n_projects, seed):
+    '''One row of fixed attributes per synthetic project'''
+    rng = np.random.default_rng([seed, 0])
+    words, suffixes = NAME_WORDS
+    names = ["THE {} {}".format(word, suffix) for word in words for suffix in suffixes]
+    names = [names[i % len(names)] + ("" if i < len(names) else " {}".format(i // len(names) + 1))
+             for i in rng.permutation(max(n_projects, len(names)))[:n_projects]]
+
+    area = rng.integers(len(PLANNING_AREAS), size=n_projects)
+    region = np.array([PLANNING_AREAS[i][0] for i in area])
+    launch = FIRST_DAY + rng.integers(0, (LAST_DAY - FIRST_DAY).astype(int) - 4 * 365, size=n_projects)
+    freehold = rng.random(n_projects) < 0.25
+
+    return pd.DataFrame({
+        'Project Name': names,
+        'Street': ["{} ROAD".format(name.split(" ")[1]) for name in names],
+        'Property Type': rng.choice(PROPERTY_TYPES[0], p=PROPERTY_TYPES[1], size=n_projects),
+        'Tenure': np.where(freehold, 'Freehold',
+                           ["99 yrs lease commencing from {}".format(year) for year in launch.astype('datetime64[Y]').astype(int) + 1970]),
+        'Postal District': [PLANNING_AREAS[i][2] for i in area],
+        'Planning Region': region,
+        'Planning Area': [PLANNING_AREAS[i][1] for i in area],
+        'Type of Area': np.where(rng.random(n_projects) < 0.03, 'Land', 'Strata'),
+        'launch': launch,
+        'base_psf': np.array([REGION_PSF[r] for r in region]) * rng.lognormal(0, 0.2, n_projects),
+        'growth': rng.normal(0.03, 0.03, n_projects),
+        'mean_area': rng.choice([700, 900, 1100, 1300, 1600, 2200], size=n_projects),
+        # Zipf-like popularity: a few large developments hold many of the units
+        'weight': rng.pareto(1.5, n_projects) + 1,
+    })
+
+def make_transactions(projects, n_units, first_unit, seed, chunk):
+    '''Raw export rows for units first_unit .. first_unit + n_units: one sale from the developer plus a
+    Poisson number of resales each, priced from the project's launch PSF and growth rate'''
+    rng = np.random.default_rng([seed, chunk + 1])
+    uid = first_unit + np.arange(n_units)
+    project = rng.choice(len(projects), p=projects['weight'] / projects['weight'].sum(), size=n_units)
+    resales = rng.poisson(MEAN_RESALES, n_units)
+    rows = 1 + resales
+
+    unit = np.repeat(np.arange(n_units), rows)
+    sale_no = np.arange(len(unit)) - np.repeat(np.cumsum(rows) - rows, rows)
+    proj = projects.iloc[project[unit]].reset_index(drop=True)
+
+    area = np.round(proj['mean_area'].to_numpy() * rng.lognormal(0, 0.15, n_units)[unit], 1)
+    new_day = proj['launch'].to_numpy(dtype='datetime64[D]') + rng.integers(0, 3 * 365, n_units)[unit]
+    # Resales come at least half a year apart; those falling after LAST_DAY are not in the export yet
+    gaps = np.where(sale_no > 0, 182 + rng.exponential(4 * 365 - 182, len(unit)), 0).astype(int)
+    offset = np.cumsum(gaps) - np.repeat(np.cumsum(gaps)[np.cumsum(rows) - rows], rows)
+    day = new_day + offset
+    years = (day - new_day).astype(int) / 365.25
+    psf = proj['base_psf'].to_numpy() * (1 + proj['growth'].to_numpy()) ** years * rng.lognormal(0, 0.08, len(unit))
+    price = np.round(psf * area, -3).astype('int64')
+
+    sale_type = np.where(sale_no > 0, 'Resale', np.where(rng.random(n_units) < 0.02, 'Sub Sale', 'New Sale')[unit])
+    u = uid[unit]
+    address = pd.Series(u // 800 + 1).astype(str) + " " + proj['Street'] + " #" \
+        + pd.Series((u // 20) % 40 + 1).astype(str).str.zfill(2) + "-" + pd.Series(u % 20 + 1).astype(str).str.zfill(2)
+
+    return pd.DataFrame({
+        'Project Name': proj['Project Name'],
+        'Transacted Price ($)': pd.Series(price).map('{:,}'.format),
+        'Area (SQFT)': pd.Series(area).map('{:,.1f}'.format),
+        'Unit Price ($ PSF)': pd.Series(np.round(price / area).astype('int64')).map('{:,}'.format),
+        'Sale Date': pd.Series(day.astype('datetime64[ns]')).dt.strftime('%d/%m/%Y'),
+        'Address': address,
+        'Type of Sale': sale_type,
+        'Type of Area': proj['Type of Area'],
+        'Property Type': proj['Property Type'],
+        'Tenure': proj['Tenure'],
+        'Postal District': proj['Postal District'],
+        'Planning Region': proj['Planning Region'],
+        'Planning Area': proj['Planning Area'],
+    }, columns=RAW_HEADER).loc[day <= LAST_DAY].reset_index(drop=True)
+
+def generate_realis(n_rows, seed=0, chunk_units=200000):
+    '''Yields seeded raw REALIS export chunks totalling exactly n_rows rows. Projects scale with the
+    row count at about UNITS_PER_PROJECT units each, and every unit averages 1 + MEAN_RESALES rows'''
+    projects = make_projects(max(10, int(n_rows / (1 + MEAN_RESALES)) // UNITS_PER_PROJECT), seed)
+    total, chunk = 0, 0
+    while total < n_rows:
+        units = min(chunk_units, max(1, int((n_rows - total) / (1 + MEAN_RESALES))))
+        df = make_transactions(projects, units, chunk * chunk_units, seed, chunk).iloc[:n_rows - total]
+        total += len(df)
+        chunk += 1
+        yield df
+
+def write_realis(path, n_rows, seed=0):
+    '''Writes a synthetic export chunk by chunk, so 10M-row files never sit in memory whole; returns the row count'''
+    total = 0
+    for i, chunk in enumerate(generate_realis(n_rows, seed)):
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        total += len(chunk)
+
+    return total
@@ -1,7 +1,53 @@
+import base64
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
 import streamlit as st
 
 backend = "http://127.0.0.1:8000"
+use_report = True
+lists_ttl = 600
+results_ttl = 300
+search_limit = 20
+
+@st.cache_resource
+def get_session():
+    '''One keep-alive connection pool to the backend, shared by every rerun and session'''
+    session = requests.Session()
+    session.mount(backend, HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
+    return session
+
+@st.cache_data(ttl=lists_ttl)
+def fetch_planareas():
+    '''Planning areas; they only change when the backend loads new data'''
+    return get_session().get(backend + '/planningareas').json()
+
+@st.cache_data(ttl=lists_ttl)
+def search_projects(text):
+    '''Best matching project names for the search box, or the most traded projects when it is empty'''
+    return get_session().get(backend + '/searchprojects', params={"q": text, "limit": search_limit}).json()["projects"]
+
+@st.cache_data(ttl=results_ttl)
+def fetch_report(params):
+    '''Gets stats, both charts and top/bottom performers from the combined /report endpoint'''
+    report = get_session().get(backend + '/report', params=params).json()
+    charts = [base64.b64decode(chart) for chart in (report['chart_price'], report['chart_growth']) if chart]
+
+    return {"stat_dict": report['stat_dict']}, charts, {"top_dict": report['top_dict']}, {"bottom_dict": report['bottom_dict']}
+
+@st.cache_data(ttl=results_ttl)
+def fetch_separately(params):
+    '''Gets the same results through the individual stats, chart and performer endpoints, requested concurrently'''
+    session = get_session()
+    paths = ['/stats', '/chartprice', '/chartgrowth', '/performerstop', '/performersbottom']
+    with ThreadPoolExecutor(max_workers=len(paths)) as pool:
+        stats, chart_price, chart_growth, df_top, df_bottom = pool.map(lambda path: session.get(backend + path, params=params), paths)
+
+    # Chart endpoints answer with JSON null instead of a PNG when nothing matched
+    charts = [chart.content for chart in (chart_price, chart_growth) if chart.headers.get('content-type') == 'image/png']
+
+    return stats.json(), charts, df_top.json(), df_bottom.json()
 
 def main():
     
@@ -13,8 +59,13 @@ def main():
 
     st.title("Through The Looking Glass: Singapore's Property Landscape")
     
-    prop_list = requests.get(backend + '/propnames').json()
-    planarea_list = requests.get(backend + '/planningareas').json()
+    planarea_list = fetch_planareas()
+
+    # Outside the form so typing narrows the project options straight away
+    search_text = st.sidebar.text_input(
+        label='Search Property Project',
+        placeholder="Type part of a project name"
+        )
     
     form = st.sidebar.form("form", clear_on_submit=True)
     with form:
@@ -23,7 +74,7 @@ def main():
 
         propname = st.selectbox(
         label='Select Property Project',
-        options=prop_list["proplists"],
+        options=['All'] + search_projects(search_text.strip()),
         help = "If searching for a specific property, do not select Property Type or Planning Area!"
         )
 
@@ -92,9 +143,8 @@ def main():
             st.subheader(min_year)
         
         with st.spinner('Retrieving relevant transactions...'):
-            stats = requests.get(
-                backend + '/stats', 
-                params={"propname": propname,"proptype": property_type,"planarea": planarea,"propsize_min": prop_size_min,"propsize_max": prop_size_max,"newsaleyear": min_year}).json()
+            params = {"propname": propname,"proptype": property_type,"planarea": planarea,"propsize_min": prop_size_min,"propsize_max": prop_size_max,"newsaleyear": min_year}
+            stats, charts, df_top, df_bottom = fetch_report(params) if use_report else fetch_separately(params)
 
         count_transactions = stats['stat_dict']['Price Differential (%)']['count']
         
@@ -143,31 +193,11 @@ def main():
                     )
 
 
-            with st.spinner('Generating charts...'):
-
-                chart1= requests.get(
-                        backend + '/chartprice',
-                        params={"propname": propname,"proptype": property_type,"planarea": planarea,"propsize_min": prop_size_min,"propsize_max": prop_size_max,"newsaleyear": min_year}
-                        ).content
-
-                chart2= requests.get(
-                        backend + '/chartgrowth',
-                        params={"propname": propname,"proptype": property_type,"planarea": planarea,"propsize_min": prop_size_min,"propsize_max": prop_size_max,"newsaleyear": min_year}
-                        ).content
+            st.image(charts,width=600)
 
-                st.image([chart1,chart2],width=600)
-
-            df_top = requests.get(
-                backend + '/performerstop', 
-                params={"propname": propname,"proptype": property_type,"planarea": planarea,"propsize_min": prop_size_min,"propsize_max": prop_size_max,"newsaleyear": min_year}).json()
-            
             with st.expander("Expand to view Top Performers for your selection (by Median Annualized Gain)"):
                 st.dataframe(df_top['top_dict'], height = 350)
             
-            df_bottom = requests.get(
-                backend + '/performersbottom', 
-                params={"propname": propname,"proptype": property_type,"planarea": planarea,"propsize_min": prop_size_min,"propsize_max": prop_size_max,"newsaleyear": min_year}).json()
-            
             with st.expander("Expand to view Bottom Performers for your selection (by Median Annualized Gain)"):
                 st.dataframe(df_bottom['bottom_dict'], height = 350)
             
@@ -1,91 +1,113 @@
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import io
 from datetime import datetime
 import re
 
+# Same compact schema as backend/src/utils.py: categoricals for repeated strings, the narrowest numeric
+# widths that hold the REALIS value ranges, and nanosecond datetimes for the two sale dates
+SCHEMA = {
+    'Project Name': 'category',
+    'New Sale Price ($)': 'int32',
+    'New Sale Price (PSF)': 'int32',
+    'Area (SQFT)': 'float32',
+    'Address': 'category',
+    'Property Type': 'category',
+    'Tenure': 'category',
+    'Postal District': 'int8',
+    'Planning Region': 'category',
+    'Planning Area': 'category',
+    'Resale Price ($)': 'int32',
+    'Resale Price (PSF)': 'int32',
+    'Market Segment': 'category',
+    'New Sale Datetime': 'datetime64[ns]',
+    'Resale Datetime': 'datetime64[ns]',
+    'Property Age (Years)': 'float32',
+    'Price Differential (%)': 'float32',
+    'Annualized Growth': 'float32',
+}
+PROCESSED_DATETIMES = [col for col, dtype in SCHEMA.items() if dtype.startswith('datetime64')]
+PROCESSED_DTYPES = {col: dtype for col, dtype in SCHEMA.items() if col not in PROCESSED_DATETIMES}
+
+def apply_schema(df):
+    '''Casts a processed table to SCHEMA; columns already at their schema dtype are not copied'''
+    return df.astype({col: dtype for col, dtype in SCHEMA.items() if col in df.columns and df[col].dtype != dtype})
+
+def read_processed_table(csv_file="streamlit_cloud_demo/data/realis_processed.csv"):
+    '''Reads the processed table with categorical strings and parsed datetimes'''
+    df = pd.read_csv(csv_file, dtype=PROCESSED_DTYPES, parse_dates=PROCESSED_DATETIMES)
+
+    return apply_schema(df)
+
 def get_prop_list(df):
-     prop_list = df['Project Name'].tolist()
-     prop_list = sorted(list(set(prop_list)))
+     prop_list = df['Project Name'].dropna().unique().tolist()
+     prop_list = sorted(prop_list)
 
      return prop_list
 
 def get_planarea_list(df):
-     planarea_list = df['Planning Area'].tolist()
-     planarea_list = sorted(list(set(planarea_list)))
+     planarea_list = df['Planning Area'].dropna().unique().tolist()
+     planarea_list = sorted(planarea_list)
 
      return planarea_list
 
 def get_filtered_table(propname,proptype,planarea,propsize_min,propsize_max,newsaleyear,df):
-    
+    '''Rows matching the selection, gathered once from a single mask; the shared df is never modified'''
+    mask = df['Area (SQFT)'].between(int(propsize_min), int(propsize_max)).to_numpy()
+
     if propname != "All":
-        df = df.loc[(df['Project Name']==propname)]
+        mask = mask & (df['Project Name']==propname).to_numpy()
 
     if proptype != "All":
-        df = df.loc[(df['Property Type']==proptype)]
+        mask = mask & (df['Property Type']==proptype).to_numpy()
     
     if planarea != "All":
-        df = df.loc[(df['Planning Area'].isin(planarea.split(",")))]
+        mask = mask & df['Planning Area'].isin(planarea.split(",")).to_numpy()
 
     if newsaleyear != "All":
-        df['New Sale Datetime'] = pd.to_datetime(df['New Sale Datetime'])
-        df = df.loc[(df['New Sale Datetime'].dt.year>=int(newsaleyear))]
-
-    df['Area (SQFT)'].astype(int)
-    df = df.loc[(df['Area (SQFT)'].between(int(propsize_min), int(propsize_max)))]
+        mask = mask & (pd.to_datetime(df['New Sale Datetime']).dt.year>=int(newsaleyear)).to_numpy()
     
-    return df
+    return df.loc[mask]
 
 def get_stats(df):
-    df.astype({'Price Differential (%)': 'float', 'Annualized Growth': 'float','Property Age (Years)':'float'})
-    df_stats = df[['Price Differential (%)','Annualized Growth','Property Age (Years)']].describe()
+    df_stats = df[['Price Differential (%)','Annualized Growth','Property Age (Years)']].astype('float64').describe()
     dict_stats = df_stats.fillna(0).to_dict()
     
     return dict_stats
 
-def get_chart_pricediff(df):
-    
-    df = df[["Project Name", "Area (SQFT)","Postal District","Market Segment","Property Age (Years)","Price Differential (%)"]]
-    df_visual = df.copy()
-    df_visual['Price Differential (%)'] = df_visual['Price Differential (%)'].apply(lambda x: x*100)
-    
-    
-    plt.hist(df_visual['Price Differential (%)'], color = '#b35900', edgecolor = 'black',
-            bins = int(1/0.01))
-
-    plt.title('Range of Capital Gains/Losses')
-    plt.xlabel('Gain/Loss on Sale (%)')
-    plt.ylabel('No. of Transactions')
+def render_histogram(values, color, title, xlabel, **hist_args):
+    '''Draws a histogram on a private Agg figure, so concurrent sessions never share pyplot state'''
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.hist(values, color = color, edgecolor = 'black', **hist_args)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel('No. of Transactions')
 
-    chart_pricediff = io.BytesIO()
-    plt.savefig(chart_pricediff, format='png')
-    plt.clf()
-    chart_pricediff.seek(0)
+    chart = io.BytesIO()
+    fig.savefig(chart, format='png')
+    chart.seek(0)
 
-    return chart_pricediff
+    return chart
 
-def get_chart_anngrowth(df):
-    
-    df = df[["Project Name", "Area (SQFT)","Postal District","Market Segment","Property Age (Years)","Annualized Growth"]]
-    df_visual = df.copy()
-    df_visual['Annualized Growth'] = df_visual['Annualized Growth'].apply(lambda x: x*100)
-
-    plt.hist(df_visual['Annualized Growth'], color = '#007399', edgecolor = 'black',
-            bins = int(0.5/0.005), range=(df_visual['Annualized Growth'].min(), df_visual['Annualized Growth'].max() if df_visual['Annualized Growth'].max()<=100 else 100))
+def get_chart_pricediff(df):
+    values = df['Price Differential (%)'].to_numpy(dtype='float64') * 100
 
-    plt.title('Range of Annualized Growth')
-    plt.xlabel('Price Growth/Year (%)')
-    plt.ylabel('No. of Transactions')
+    return render_histogram(values, '#b35900', 'Range of Capital Gains/Losses', 'Gain/Loss on Sale (%)',
+                            bins = int(1/0.01))
 
-    chart_anngrowth = io.BytesIO()
-    plt.savefig(chart_anngrowth, format='png')
-    plt.clf()
-    chart_anngrowth.seek(0)
+def get_chart_anngrowth(df):
+    values = df['Annualized Growth'].to_numpy(dtype='float64') * 100
+    low, high = np.nanmin(values), np.nanmax(values)
 
-    return chart_anngrowth
+    return render_histogram(values, '#007399', 'Range of Annualized Growth', 'Price Growth/Year (%)',
+                            bins = int(0.5/0.005), range=(low, high if high<=100 else 100))
 
 def get_performers(df):
-    df = df.groupby(['Project Name','Property Type','Planning Area']).agg(
+    df = df.groupby(['Project Name','Property Type','Planning Area'], observed=True).agg(
         {
         'Project Name':['count'],
         'Annualized Growth': ['median'],
@@ -104,7 +126,10 @@ def get_performers(df):
 
     df["Median Annualized Growth (%)"] = df["Median Annualized Growth (%)"].apply(lambda x: round(x*100,1))
     df["Median Resale Price"] = df["Median Resale Price"].apply(lambda x: int(x))
-    df["Last Resale Transaction"] = df["Last Resale Transaction"].apply(lambda x: re.search(r'\b\d{4}\b', x).group())
+    if pd.api.types.is_datetime64_any_dtype(df["Last Resale Transaction"]):
+        df["Last Resale Transaction"] = df["Last Resale Transaction"].dt.year.astype(str)
+    else:
+        df["Last Resale Transaction"] = df["Last Resale Transaction"].apply(lambda x: re.search(r'\b\d{4}\b', x).group())
     df = df.sort_values(by=['Median Annualized Growth (%)'],ascending=False)
     df = df.set_index('Project Name')
 
@@ -1,6 +1,18 @@
 import streamlit as st
-from src.st_utils import get_prop_list,get_planarea_list, get_filtered_table, get_stats, get_chart_pricediff, get_chart_anngrowth, get_performers
-import pandas as pd
+from src.st_utils import read_processed_table, get_prop_list,get_planarea_list, get_filtered_table, get_stats, get_chart_pricediff, get_chart_anngrowth, get_performers
+
+@st.cache_resource(max_entries=1)
+def read_data(csv_file="streamlit_cloud_demo/data/realis_processed.csv"):
+    '''Loaded once per process and shared by every session; callers must treat it as read-only'''
+    return read_processed_table(csv_file)
+
+@st.cache_resource(max_entries=1)
+def read_lists(csv_file="streamlit_cloud_demo/data/realis_processed.csv"):
+    df = read_data(csv_file)
+    prop_list = get_prop_list(df)
+    prop_list.insert(0,"All")
+
+    return prop_list, get_planarea_list(df)
 
 def main():
     
@@ -12,16 +24,8 @@ def main():
 
     st.title("Through The Looking Glass: Singapore's Property Landscape")
     
-    def read_data(csv_file="streamlit_cloud_demo/data/realis_processed.csv"):
-        df = pd.read_csv(csv_file)
-        return df
-
     df_realis = read_data()
-
-    prop_list = get_prop_list(df_realis)
-    prop_list.insert(0,"All")
-
-    planarea_list = get_planarea_list(df_realis)
+    prop_list, planarea_list = read_lists()
     
     form = st.sidebar.form("form", clear_on_submit=True)
     with form:
@@ -0,0 +1,33 @@
+import numpy as np
+from backend.src.cache import ResultCache, normalize_query, MISSING
+
+def test_normalize_query_planarea_order():
+    assert normalize_query("All","All","B,A",200,"2000","All") == normalize_query("All","All","A,B,A","200",2000,"All")
+
+def test_lru_eviction_and_counters():
+    cache = ResultCache(max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put("v1", key, "stats", {"count": 1})
+    assert cache.get("v1", "a", "stats") is MISSING
+    assert cache.get("v1", "c", "stats") == {"count": 1}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 1)
+
+def test_byte_budget_and_ttl():
+    now = [0.0]
+    cache = ResultCache(max_bytes=1000, ttl=10, clock=lambda: now[0])
+    cache.put("v1", "a", "positions", np.arange(100))
+    cache.put("v1", "b", "positions", np.arange(100))
+    assert len(cache) == 1 and cache.nbytes <= 1000
+    now[0] = 11
+    assert cache.get("v1", "b", "positions") is MISSING
+    assert cache.stats()["expirations"] == 1
+
+def test_version_change_invalidates():
+    cache = ResultCache()
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert cache.get_or_compute("v1", "a", "stats", compute) == 1
+    assert cache.get_or_compute("v1", "a", "stats", compute) == 1
+    assert cache.get_or_compute("v2", "a", "stats", compute) == 2
+    assert cache.stats()["invalidations"] == 1
@@ -0,0 +1,33 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+import matplotlib.pyplot as plt
+from backend.src.utils import read_processed_table, get_filtered_table, get_chart_pricediff, get_chart_anngrowth
+from backend.src.charts import ChartRenderer
+
+df = read_processed_table("tests/mock_data/mock_realis_processed.csv")
+
+def pyplot_pricediff(df):
+    plt.hist(df['Price Differential (%)']*100, color = '#b35900', edgecolor = 'black', bins = int(1/0.01))
+    plt.title('Range of Capital Gains/Losses')
+    plt.xlabel('Gain/Loss on Sale (%)')
+    plt.ylabel('No. of Transactions')
+    chart = io.BytesIO()
+    plt.savefig(chart, format='png')
+    plt.clf()
+    return chart.getvalue()
+
+def test_figure_rendering_matches_pyplot():
+    assert get_chart_pricediff(df).read() == pyplot_pricediff(df)
+
+def test_renderer_parallel_and_cached():
+    renderer = ChartRenderer(max_workers=4)
+    frames = [get_filtered_table("All","All","All",200,2000,year,df=df) for year in ("All","2003","2006","2009")]
+    expected = [(get_chart_pricediff(frame).read(), get_chart_anngrowth(frame).read()) for frame in frames]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda i: (renderer.chart(frames[i % 4], 'pricediff'), renderer.chart(frames[i % 4], 'anngrowth')), range(32)))
+
+    for i, result in enumerate(results):
+        assert result == expected[i % 4]
+    assert renderer.stats()["misses"] == 8
+    renderer.shutdown()
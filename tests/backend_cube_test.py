@@ -0,0 +1,34 @@
+import numpy as np
+from backend.src.utils import read_processed_table, get_filtered_table
+from backend.src.cube import HistogramCube, grid_bins, grid_histogram, chart_bins, GRIDS
+
+df = read_processed_table("tests/mock_data/mock_realis_processed.csv")
+cube = HistogramCube(df)
+
+def test_cube_matches_filtered_rows():
+    queries = [
+        ("All","All","All",200,2000,"All"),
+        ("All","Condominium","Bukit Merah,Bedok",600,1200,"2005"),
+        ("THE INTERLACE","All","All",100,8000,"All"),
+        ("All","Executive Condominium","Sengkang",1000,1200,"2003"),
+        ("NO SUCH PROJECT","All","All",200,2000,"All"),
+    ]
+    for query in queries:
+        df_filtered = get_filtered_table(*query, df=df)
+        for name in GRIDS:
+            assert np.array_equal(cube.histogram(name, *query), grid_histogram(df_filtered, name))
+
+def test_unaligned_area_bounds_fall_back():
+    assert cube.histogram('pricediff', "All","All","All",250,2000,"All") is None
+
+def test_chart_bins_crop_and_merge():
+    counts = np.zeros(len(GRIDS['pricediff'][1]) - 1, dtype='int64')
+    counts[[10, 11, 300]] = [2, 3, 4]
+    merged, edges = chart_bins(counts, GRIDS['pricediff'][1])
+    assert len(merged) <= 100 and merged.sum() == 9
+    assert edges[0] == GRIDS['pricediff'][1][10] and len(edges) == len(merged) + 1
+
+def test_off_grid_values_are_left_out():
+    edges = GRIDS['anngrowth'][1]
+    bins = grid_bins(np.array([-100.0, 99.9, 100.0, 100.1, 250.0, np.inf, np.nan]), edges)
+    assert bins.tolist() == [0, len(edges) - 2, len(edges) - 2, -1, -1, -1, -1]
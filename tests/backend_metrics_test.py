@@ -0,0 +1,25 @@
+from backend.src.metrics import Metrics
+from backend.src.utils import STAGE_OBSERVERS, timed_stage
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    for seconds in (0.002, 0.02, 0.2, 20):
+        metrics.observe_request("/stats", 200, seconds)
+    text = metrics.render({"cache_hits": 3})
+    assert 'propalantir_request_duration_seconds_bucket{endpoint="/stats",le="0.0025"} 1' in text
+    assert 'propalantir_request_duration_seconds_bucket{endpoint="/stats",le="0.25"} 3' in text
+    assert 'propalantir_request_duration_seconds_bucket{endpoint="/stats",le="+Inf"} 4' in text
+    assert 'propalantir_request_duration_seconds_count{endpoint="/stats"} 4' in text
+    assert 'propalantir_cache_hits 3' in text
+
+def test_timed_stage_reports_to_observers():
+    seen = []
+    with timed_stage("unobserved"):
+        pass
+    STAGE_OBSERVERS.append(lambda *args: seen.append(args))
+    try:
+        with timed_stage("filter") as span:
+            span["rows"] = 12
+    finally:
+        STAGE_OBSERVERS.pop()
+    assert [(name, rows) for name, _, rows in seen] == [("filter", 12)]
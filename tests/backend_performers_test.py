@@ -0,0 +1,30 @@
+import numpy as np
+from backend.src.utils import read_processed_table, get_filtered_table, get_performers
+from backend.src.index import FilterIndex
+from backend.src.performers import ProjectAggregates, select_extremes, RANK_COLUMN
+
+df = read_processed_table("tests/mock_data/mock_realis_processed.csv")
+index = FilterIndex(df)
+aggregates = ProjectAggregates(df)
+
+def test_top_bottom_matches_get_performers():
+    queries = [
+        ("All","All","All",200,2000,"All"),
+        ("All","All","All",1000,1200,"All"),
+        ("All","All","All",200,8000,"2005"),
+        ("All","Condominium","Bukit Merah,Bedok",600,1200,"2005"),
+        ("NO SUCH PROJECT","All","All",200,2000,"All"),
+    ]
+    for query in queries:
+        df_performers = get_performers(get_filtered_table(*query, df=df))
+        for n in (3, 10):
+            df_top, df_bottom = aggregates.top_bottom(df, index, query, n)
+            for got, expected in ((df_top, df_performers.head(n)), (df_bottom, df_performers.tail(n))):
+                assert sorted(got.index) == sorted(expected.index)
+                assert np.allclose(got[RANK_COLUMN], expected[RANK_COLUMN], equal_nan=True)
+
+def test_select_extremes_puts_nan_last():
+    values = np.array([3.0, np.nan, 7.0, 1.0, np.nan, 5.0])
+    top, bottom = select_extremes(values, 4)
+    assert top.tolist() == [2, 5, 0, 3]
+    assert bottom.tolist() == [0, 3, 1, 4]
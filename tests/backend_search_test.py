@@ -0,0 +1,30 @@
+from backend.src.utils import read_processed_table, get_prop_list
+from backend.src.search import ProjectSearch, search_key
+
+df = read_processed_table("tests/mock_data/mock_realis_processed.csv")
+search = ProjectSearch(df)
+
+def test_index_covers_every_project_most_traded_first():
+    assert sorted(search.names) == get_prop_list(df=df)
+    counts = df['Project Name'].value_counts()
+    assert [counts[name] for name in search.names] == sorted(counts, reverse=True)
+    assert search.search("", 3) == search.names[:3]
+
+def test_ranking_and_matching():
+    assert search_key("The Sail @ Marina Bay") == ["the", "sail", "marina", "bay"]
+    assert search.search("the sail @ marina bay") == ["THE SAIL @ MARINA BAY"]
+    assert search.search("marina sa") == ["THE SAIL @ MARINA BAY"]
+    the = search.search("the")
+    assert the and all(name.startswith("THE ") for name in the)
+    assert search.search("THE", 2) == the[:2]
+    assert search.search("residences") == [name for name in search.names if name.endswith(" RESIDENCES")]
+    assert search.search("bedok resdences")[0] == "BEDOK RESIDENCES"
+    assert search.search("zzzz") == []
+
+def test_close_matches_score_only_names_sharing_a_trigram():
+    assert search.search("intrelace") == ["THE INTERLACE"]
+    assert search.close_matches("zzzz", 10) == []
+    # A swapped pair of letters still leaves most trigrams of the name in place
+    ids = search.close_matches("the sial marina bay", 10)
+    assert search.names[ids[0]] == "THE SAIL @ MARINA BAY"
+    assert len(ids) == len(set(ids)) <= 10
@@ -0,0 +1,179 @@
+import sys
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, "backend")
+from fastapi.testclient import TestClient
+import server
+from src.utils import get_filtered_table, render_histogram
+
+server.store.path = "tests/mock_data/mock_realis_processed.csv"
+
+params = {"propname": "All", "proptype": "All", "planarea": "All", "propsize_min": 200, "propsize_max": 2000, "newsaleyear": "All"}
+
+def test_lists_and_stats():
+    with TestClient(server.app) as client:
+        prop_list = client.get('/propnames').json()["proplists"]
+        assert prop_list[0] == "All"
+        assert len(client.get('/planningareas').json()["planlists"]) > 0
+        stats = client.get('/stats', params=params).json()["stat_dict"]
+        assert stats['Price Differential (%)']['count'] > 0
+
+def test_performers():
+    with TestClient(server.app) as client:
+        top = client.get('/performerstop', params=params).json()["top_dict"]
+        bottom = client.get('/performersbottom', params=params).json()["bottom_dict"]
+        assert len(top['No. of Resale Transactions']) > 0
+        assert all(len(year) == 4 for year in bottom['Last Resale Transaction'].values())
+
+def test_report_matches_individual_endpoints():
+    with TestClient(server.app) as client:
+        report = client.get('/report', params=params).json()
+        assert report["stat_dict"] == client.get('/stats', params=params).json()["stat_dict"]
+        assert report["top_dict"] == client.get('/performerstop', params=params).json()["top_dict"]
+        assert report["bottom_dict"] == client.get('/performersbottom', params=params).json()["bottom_dict"]
+        assert report["chart_price"] is not None
+
+        empty = client.get('/report', params={**params, "propname": "NO SUCH PROJECT"}).json()
+        assert empty["chart_price"] is None
+        assert empty["stat_dict"]["Price Differential (%)"]["count"] == 0
+
+def test_cache_shared_across_planarea_order():
+    with TestClient(server.app) as client:
+        query = {**params, "planarea": "Bedok,Bukit Merah"}
+        first = client.get('/stats', params=query).json()
+        hits = client.get('/cachestats').json()["hits"]
+        second = client.get('/stats', params={**query, "planarea": "Bukit Merah,Bedok"}).json()
+        assert first == second
+        assert client.get('/cachestats').json()["hits"] == hits + 1
+
+def test_histograms_json():
+    with TestClient(server.app) as client:
+        histograms = client.get('/histograms', params=params).json()
+        stats = client.get('/stats', params=params).json()["stat_dict"]
+        assert sum(histograms["pricediff"]["counts"]) == stats['Price Differential (%)']['count']
+        assert len(histograms["anngrowth"]["edges"]) == len(histograms["anngrowth"]["counts"]) + 1
+        assert client.get('/chartprice', params={**params, "propsize_min": 250}).headers["content-type"] == "image/png"
+
+def test_stats_modes_agree_on_small_results():
+    with TestClient(server.app) as client:
+        exact = client.get('/stats', params={**params, "statsmode": "exact"}).json()
+        approx = client.get('/stats', params={**params, "statsmode": "approx"}).json()
+        assert exact["stat_mode"] == "exact" and approx["stat_mode"] == "approx"
+        assert approx["stat_dict"]['Price Differential (%)']['count'] == exact["stat_dict"]['Price Differential (%)']['count']
+        assert client.get('/stats', params=params).json()["stat_mode"] == "exact"
+
+def test_overload_returns_503():
+    with TestClient(server.app) as client:
+        limit, server.workers.max_pending = server.workers.max_pending, 0
+        try:
+            response = client.get('/stats', params={**params, "propsize_max": 1999})
+            assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+        finally:
+            server.workers.max_pending = limit
+
+def test_metrics_exposition():
+    with TestClient(server.app) as client:
+        client.get('/performerstop', params={**params, "propsize_max": 1998})
+        client.get('/stats', params={**params, "propsize_max": 1998, "statsmode": "exact"})
+        client.get('/no/such/path')
+        text = client.get('/metrics').text
+        assert 'propalantir_requests_total{endpoint="/performerstop",status="200"}' in text
+        assert 'propalantir_requests_total{endpoint="other",status="404"}' in text
+        assert 'propalantir_stage_duration_seconds_count{stage="top_bottom"}' in text
+        assert 'propalantir_result_rows_bucket{stage="filter",le="+Inf"}' in text
+        assert 'propalantir_requests_in_flight 1' in text
+
+def test_opt_in_request_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "profile_dir", str(tmp_path))
+    with TestClient(server.app) as client:
+        client.get('/chartprice', params=params)
+        assert list(tmp_path.iterdir()) == []
+        response = client.get('/chartprice', params={**params, "planarea": "Bukit Merah,Bedok"}, headers={"X-Profile": "1"})
+        assert response.status_code == 200
+        assert response.content == client.get('/chartprice', params={**params, "planarea": "Bedok,Bukit Merah"}).content
+
+    name = response.headers["X-Profile-Id"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [name + ".prof", name + ".txt"]
+    summary = (tmp_path / (name + ".txt")).read_text()
+    assert '"Bedok,Bukit Merah"' in summary and "render_histogram" in summary and "top allocation sites" in summary
+
+def test_profiled_request_leaves_the_loop_free(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "profile_dir", str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+    def held_render(*args):
+        started.set()
+        assert release.wait(10)
+        return render_histogram(*args)
+    monkeypatch.setattr(server, "render_histogram", held_render)
+
+    with TestClient(server.app) as client, ThreadPoolExecutor(1) as pool:
+        profiled = pool.submit(client.get, '/chartprice', params=params, headers={"X-Profile": "1"})
+        assert started.wait(10)
+        # Served while the profiled render is still held
+        assert client.get('/propnames').status_code == 200
+        release.set()
+        assert profiled.result().status_code == 200
+
+    summary = (tmp_path / (profiled.result().headers["X-Profile-Id"] + ".txt")).read_text()
+    assert "held_render" in summary and "(process-wide" in summary
+
+def test_etags_and_conditional_gets():
+    with TestClient(server.app) as client:
+        first = client.get('/chartprice', params={**params, "planarea": "Bukit Merah,Bedok"})
+        etag = first.headers["ETag"]
+        assert etag.startswith('W/"')
+        assert "max-age" in first.headers["Cache-Control"]
+        assert client.get('/chartprice', params={**params, "planarea": "Bedok,Bukit Merah"}).headers["ETag"] == etag
+        again = client.get('/chartprice', params={**params, "planarea": "Bedok,Bukit Merah"}, headers={"If-None-Match": etag})
+        assert again.status_code == 304 and again.content == b""
+        assert client.get('/chartgrowth', params=params).headers["ETag"] != client.get('/chartprice', params=params).headers["ETag"]
+
+        lists = client.get('/propnames')
+        assert client.get('/propnames', headers={"If-None-Match": lists.headers["ETag"]}).status_code == 304
+        assert client.get('/propnames', headers={"If-None-Match": lists.headers["ETag"].removeprefix("W/")}).status_code == 304
+        gzipped = client.get('/report', params=params, headers={"Accept-Encoding": "gzip"})
+        assert gzipped.headers["Content-Encoding"] == "gzip" and gzipped.headers["ETag"].startswith('W/"')
+        assert client.get('/cachestats').headers["Cache-Control"] == "no-store"
+
+def test_compact_performer_formats_and_gzip():
+    with TestClient(server.app) as client:
+        columns = client.get('/performerstop', params=params).json()["top_dict"]
+        records = client.get('/performerstop', params={**params, "format": "records"}).json()["top_dict"]
+        arrays = client.get('/performerstop', params={**params, "format": "arrays"}).json()["top_dict"]
+        assert [row["Project Name"] for row in records] == arrays["Project Name"] == list(columns["Median Resale Price"])
+        assert arrays["Median Resale Price"] == list(columns["Median Resale Price"].values())
+
+        report = client.get('/report', params=params, headers={"Accept-Encoding": "gzip"})
+        assert report.headers["Content-Encoding"] == "gzip"
+        assert "Content-Encoding" not in client.get('/chartprice', params=params, headers={"Accept-Encoding": "gzip"}).headers
+
+def test_transactions_stream_and_paginate():
+    with TestClient(server.app) as client:
+        full = client.get('/transactions', params=params)
+        assert full.headers["Content-Type"].startswith("application/x-ndjson") and "X-Next-Cursor" not in full.headers
+        rows = [json.loads(line) for line in full.text.splitlines()]
+        assert len(rows) == len(get_filtered_table(*params.values(), df=server.store.current().df))
+
+        paged, cursor = [], None
+        while True:
+            response = client.get('/transactions', params={**params, "limit": 7, **({"cursor": cursor} if cursor else {})})
+            paged.extend(json.loads(line) for line in response.text.splitlines())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+        assert paged == rows
+
+        csv = client.get('/transactions', params={**params, "format": "csv", "columns": "Project Name,Resale Datetime", "limit": 3}).text
+        assert csv.splitlines()[0] == "Project Name,Resale Datetime" and len(csv.splitlines()) == 4
+        assert client.get('/transactions', params={**params, "columns": "Nope"}).status_code == 400
+        assert client.get('/transactions', params={**params, "cursor": "garbage"}).status_code == 400
+        if server.pa is None:
+            assert client.get('/transactions', params={**params, "format": "arrow"}).status_code == 501
+
+def test_project_search():
+    with TestClient(server.app) as client:
+        projects = client.get('/searchprojects', params={"q": "the", "limit": 2}).json()["projects"]
+        assert len(projects) == 2 and all(name.startswith("THE ") for name in projects)
+        assert set(client.get('/searchprojects', params={"limit": 100}).json()["projects"]) == set(client.get('/propnames').json()["proplists"][1:])
+        assert client.get('/searchprojects', params={"q": "the", "limit": 0}).status_code == 422
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+from backend.src.utils import read_processed_table, get_filtered_table, get_stats
+from backend.src.cube import HistogramCube
+from backend.src.sketch import StatsSketch, STAT_COLUMNS
+
+def test_zero_eps_is_exact():
+    df = read_processed_table("tests/mock_data/mock_realis_processed.csv")
+    sketch = StatsSketch(df, HistogramCube(df), eps=0)
+    query = ("All","Condominium","All",200,2000,"2003")
+    dict_stats, rank_error = sketch.stats(*query)
+    expected = get_stats(get_filtered_table(*query, df=df))
+    for col in STAT_COLUMNS:
+        assert rank_error[col] == 0
+        for stat, value in expected[col].items():
+            assert np.isclose(dict_stats[col][stat], value, rtol=1e-9)
+
+def test_rank_error_bound():
+    rng = np.random.default_rng(0)
+    n = 200000
+    areas = ['Bedok', 'Yishun', 'Queenstown', 'Tampines']
+    df = pd.DataFrame({
+        'Project Name': rng.choice(["P{}".format(i) for i in range(3000)], n),
+        'Property Type': rng.choice(['Condominium', 'Executive Condominium'], n),
+        'Planning Area': rng.choice(areas, n),
+        'New Sale Datetime': pd.to_datetime('2003-01-01') + pd.to_timedelta(rng.integers(0, 5 * 365, n), unit='D'),
+        'Area (SQFT)': rng.integers(5, 20, n) * 100.0 + rng.choice([0, 50], n),
+        'Price Differential (%)': rng.normal(0.3, 0.4, n),
+        'Annualized Growth': rng.normal(0.05, 0.1, n),
+        # Few distinct values, so quantiles land on long runs of ties
+        'Property Age (Years)': rng.uniform(0, 15, n).round(1),
+    })
+    cube = HistogramCube(df)
+    sketch = StatsSketch(df, cube, eps=0.01)
+    # Cells hold a handful of rows each, yet each group keeps about 1 / eps values per column
+    counts = sketch.columns[STAT_COLUMNS[0]].count
+    assert np.median(counts[counts > 0]) < 8
+    n_groups = len(sketch.columns[STAT_COLUMNS[0]].group_count)
+    assert sketch.samples() <= len(STAT_COLUMNS) * n_groups * 1.1 / 0.01 < len(STAT_COLUMNS) * n / 15
+
+    queries = [("All","All","All",500,2000,"All"), ("All","Condominium","Bedok,Yishun",500,800,"2005"),
+               ("P7","All","All",500,2000,"All")]
+    for _ in range(40):
+        low = int(rng.integers(5, 19))
+        queries.append(("All", rng.choice(["All", "Condominium"]), ",".join(rng.choice(areas, rng.integers(1, 4), replace=False)),
+                        low * 100, int(rng.integers(low + 1, 21)) * 100, str(rng.choice(["All", "2004", "2006"]))))
+    for query in queries:
+        dict_stats, rank_error = sketch.stats(*query)
+        df_filtered = get_filtered_table(*query, df=df)
+        for col in STAT_COLUMNS:
+            values = np.sort(df_filtered[col].to_numpy())
+            error = rank_error[col] * len(values)
+            assert rank_error[col] <= 2 * 0.01
+            assert dict_stats[col]['count'] == len(values)
+            assert np.isclose(dict_stats[col]['mean'], values.mean())
+            assert np.isclose(dict_stats[col]['std'], values.std(ddof=1))
+            for label, q in (('25%', 0.25), ('50%', 0.5), ('75%', 0.75)):
+                low = np.searchsorted(values, dict_stats[col][label], side='left')
+                high = np.searchsorted(values, dict_stats[col][label], side='right')
+                target = q * (len(values) - 1)
+                assert low - 1 - error <= target <= high + error
+    # A single project is read exactly
+    assert sketch.stats("P7","All","All",500,2000,"All")[1] == dict.fromkeys(STAT_COLUMNS, 0.0)
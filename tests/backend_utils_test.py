@@ -1,7 +1,232 @@
-from backend.src.utils import get_prop_list
+import numpy as np
+import pandas as pd
+from backend.src.utils import get_prop_list, get_filtered_table, get_performers, read_processed_table, process_table, clean_table, match_newsale_resale, match_newsale_resale_sorted, convert_datetimes, ingest_increment, ingest_state, write_state, process_chunked, write_columnar, read_columnar
+import os
+import shutil
+from backend.src.store import DatasetStore, publish_columnar, default_data_path, read_derived
+from backend.src.utils import SCHEMA
+from streamlit_cloud_demo.src import st_utils
 
 def test_get_prop_list():
     mock_data = "tests/mock_data/mock_realis_processed.csv"
     mock_prop_list = get_prop_list(mock_data)
     assert isinstance(mock_prop_list, list)
-    assert len(mock_prop_list) > 0
\ No newline at end of file
+    assert len(mock_prop_list) > 0
+
+def test_dataset_store_snapshot():
+    mock_data = "tests/mock_data/mock_realis_processed.csv"
+    store = DatasetStore(mock_data).load()
+    df = store.snapshot()
+    assert pd.api.types.is_datetime64_any_dtype(df['New Sale Datetime'])
+    assert store.version is not None
+
+    df_filtered = get_filtered_table("All","All","All",200,2000,"2005",df=df)
+    assert len(df_filtered) == len(get_filtered_table("All","All","All",200,2000,"2005",mock_data))
+    assert df.equals(read_processed_table(mock_data))
+
+def test_filter_index_matches_get_filtered_table():
+    mock_data = "tests/mock_data/mock_realis_processed.csv"
+    store = DatasetStore(mock_data).load()
+    df = store.snapshot()
+    queries = [
+        ("All","All","All",200,2000,"All"),
+        ("All","Condominium","Bukit Merah,Bedok",200,2000,"2005"),
+        ("THE INTERLACE","All","All",100,8000,"All"),
+        ("All","Executive Condominium","All",1000,1200,"2003"),
+        ("NO SUCH PROJECT","All","All",200,2000,"All"),
+    ]
+    for query in queries:
+        expected = get_filtered_table(*query, df=df)
+        assert store.select(*query).equals(expected)
+
+def test_vectorized_pipeline_matches_rowwise():
+    df_raw = pd.read_csv("tests/mock_data/mock_realis.csv")
+    df_rowwise = process_table(df_raw.copy(), mode='rowwise')
+    df_vectorized = process_table(df_raw.copy(), mode='vectorized')
+    # The sorted join emits resales in date order and a fresh index
+    sort_cols = ['Project Name', 'Address', 'New Sale Datetime', 'Resale Datetime']
+    df_rowwise = df_rowwise.sort_values(sort_cols, ignore_index=True)
+    df_vectorized = df_vectorized.sort_values(sort_cols, ignore_index=True)
+    # numpy's array pow can differ from scalar pow in the last few bits of Annualized Growth
+    pd.testing.assert_frame_equal(df_rowwise, df_vectorized, check_exact=False, rtol=1e-12)
+
+def test_incremental_ingest_matches_full_rebuild():
+    df_raw = pd.read_csv("tests/mock_data/mock_realis.csv")
+    df_history, df_delta = df_raw.iloc[:45], df_raw.iloc[45:]
+    df_state = clean_table(df_history)
+    df_processed = process_table(df_state, cleaned=True)
+    df_added, df_processed = ingest_increment(df_state, df_processed, df_delta)
+
+    df_full = process_table(df_raw)
+    sort_cols = ['Project Name', 'Address', 'New Sale Datetime', 'Resale Datetime']
+    df_processed = df_processed.sort_values(sort_cols, ignore_index=True)
+    df_full = df_full.sort_values(sort_cols, ignore_index=True)
+    pd.testing.assert_frame_equal(df_processed, df_full)
+    assert len(df_state) + len(df_added) == len(clean_table(df_raw))
+
+def test_increment_drops_redelivered_rows_only():
+    df_raw = pd.read_csv("tests/mock_data/mock_realis.csv")
+    df_history = df_raw.iloc[:45]
+    df_state = clean_table(df_history)
+    df_processed = process_table(df_state, cleaned=True)
+    # A re-sent history row is dropped, while a repeat beyond what the history holds is kept
+    resent = df_history.loc[clean_table(df_history).index[:1]]
+    df_delta = pd.concat([resent, resent, df_raw.iloc[45:]])
+    df_added, df_processed = ingest_increment(df_state, df_processed, df_delta)
+
+    assert len(df_added) == len(clean_table(df_delta)) - 1
+    df_full = process_table(pd.concat([df_history, resent, df_raw.iloc[45:]]))
+    assert len(df_processed) == len(df_full)
+
+def test_partitioned_state_increment_matches_full_rebuild(tmp_path):
+    df_raw = pd.read_csv("tests/mock_data/mock_realis.csv")
+    df_state = clean_table(df_raw.iloc[:45])
+    write_state(tmp_path / "state", df_state, process_table(df_state, cleaned=True), n_partitions=4)
+    before = {path: os.stat(tmp_path / "state" / path).st_mtime_ns for path in os.listdir(tmp_path / "state")}
+
+    df_delta = df_raw.iloc[40:]
+    n_added = ingest_state(tmp_path / "state", df_delta, tmp_path / "processed.cols")
+    assert n_added == len(clean_table(df_raw)) - len(df_state)
+    # Partitions without rows from the batch are left as they were
+    touched = {path for path, mtime in before.items() if os.stat(tmp_path / "state" / path).st_mtime_ns != mtime}
+    assert 0 < len(touched) < len(before)
+
+    sort_cols = ['Project Name', 'Address', 'New Sale Datetime', 'Resale Datetime']
+    df_served = read_columnar(tmp_path / "processed.cols").sort_values(sort_cols, ignore_index=True)
+    df_full = process_table(df_raw).sort_values(sort_cols, ignore_index=True).astype(df_served.dtypes.to_dict())
+    pd.testing.assert_frame_equal(df_served, df_full, check_exact=False, rtol=1e-6)
+
+def test_columnar_roundtrip(tmp_path):
+    df = read_processed_table("tests/mock_data/mock_realis_processed.csv")
+    write_columnar(df, tmp_path / "realis_processed.cols")
+    df_columnar = read_columnar(tmp_path / "realis_processed.cols")
+
+    assert isinstance(df_columnar['Project Name'].dtype, pd.CategoricalDtype)
+    assert df_columnar['New Sale Datetime'].dtype == 'datetime64[ns]'
+    pd.testing.assert_frame_equal(df_columnar.astype(df.dtypes.to_dict()), df, check_dtype=False)
+
+    store = DatasetStore(str(tmp_path / "realis_processed.cols")).load()
+    query = ("All","Condominium","Bukit Merah,Bedok",200,2000,"2005")
+    assert len(store.select(*query)) == len(get_filtered_table(*query, df=df))
+    assert get_performers(store.select(*query)).to_dict() == get_performers(get_filtered_table(*query, df=df)).to_dict()
+
+def test_chunked_ingest_matches_full_pipeline(tmp_path):
+    output = tmp_path / "processed.csv"
+    n_rows = process_chunked("tests/mock_data/mock_realis.csv", output, chunksize=10, n_partitions=4,
+                             state_dir=tmp_path / "state", columnar=tmp_path / "processed.cols")
+    df_chunked = read_processed_table(output)
+    # The artifact is streamed partition by partition, its string dictionaries merged at the end
+    assert sorted(os.listdir(tmp_path / "processed.cols")) == ["{:02d}.npy".format(i) for i in range(len(df_chunked.columns))] + ["manifest.json"]
+    pd.testing.assert_frame_equal(read_columnar(tmp_path / "processed.cols"), df_chunked)
+
+    df_full = process_table(pd.read_csv("tests/mock_data/mock_realis.csv"))
+    sort_cols = ['Project Name', 'Address', 'New Sale Datetime', 'Resale Datetime']
+    df_chunked = df_chunked.sort_values(sort_cols, ignore_index=True)
+    df_full = df_full.sort_values(sort_cols, ignore_index=True).astype(df_chunked.dtypes.to_dict())
+    assert n_rows == len(df_full)
+    pd.testing.assert_frame_equal(df_chunked, df_full, check_exact=False, rtol=1e-12)
+
+def test_sorted_join_matches_merge_and_date_filter():
+    df_clean = clean_table(pd.read_csv("tests/mock_data/mock_realis.csv"))
+    df_merge = convert_datetimes(match_newsale_resale(df_clean.copy()))
+    df_sorted = match_newsale_resale_sorted(df_clean.copy())
+    assert len(df_sorted) < len(match_newsale_resale(df_clean.copy()))
+
+    df_sorted = convert_datetimes(df_sorted)
+    sort_cols = ['Project Name', 'Address', 'New Sale Datetime', 'Resale Datetime']
+    pd.testing.assert_frame_equal(df_merge.sort_values(sort_cols, ignore_index=True),
+                                  df_sorted.sort_values(sort_cols, ignore_index=True))
+
+def test_published_columnar_is_shared_read_only(tmp_path):
+    csv_file = str(tmp_path / "realis_processed.csv")
+    shutil.copy("tests/mock_data/mock_realis_processed.csv", csv_file)
+    path = publish_columnar(csv_file)
+    manifest_mtime = os.stat(os.path.join(path, "manifest.json")).st_mtime_ns
+    assert publish_columnar(csv_file) == path
+    assert os.stat(os.path.join(path, "manifest.json")).st_mtime_ns == manifest_mtime
+
+    view = DatasetStore(path).load().current()
+    df = view.df
+    assert not df['Area (SQFT)'].to_numpy().flags.writeable
+    assert not df['Project Name'].array.codes.flags.writeable
+    assert len(df) == len(read_processed_table(csv_file))
+
+    # The prebuilt structures are mapped from the artifact too, and answer like freshly built ones
+    assert not view.index.area.order.flags.writeable and not view.cube.cell_of_row.flags.writeable
+    assert not view.performers.group_of_row.flags.writeable
+    built = DatasetStore(csv_file).load().current()
+    query = ("All","Condominium","Bukit Merah,Bedok",200,2000,"2005")
+    assert np.array_equal(view.index.positions(*query), built.index.positions(*query))
+    assert np.array_equal(view.cube.histogram('pricediff', *query), built.cube.histogram('pricediff', *query))
+    assert view.sketch.stats(*query) == built.sketch.stats(*query)
+    assert view.search.search("the") == built.search.search("the")
+
+    os.remove(os.path.join(path, "derived.pkl"))
+    assert DatasetStore(path).load().current().index.area.order.flags.writeable
+    publish_columnar(csv_file)
+    assert os.stat(os.path.join(path, "manifest.json")).st_mtime_ns == manifest_mtime
+    assert "derived.pkl" in os.listdir(path)
+
+    os.utime(csv_file, ns=(manifest_mtime + 10**9, manifest_mtime + 10**9))
+    publish_columnar(csv_file)
+    assert os.stat(os.path.join(path, "manifest.json")).st_mtime_ns > manifest_mtime
+    assert sorted(os.listdir(tmp_path)) == ["realis_processed.cols", "realis_processed.csv"]
+
+def test_schema_bytes_per_row(tmp_path):
+    # Repeat the mock rows so category dictionaries are amortized as they are on the real table
+    csv_file = tmp_path / "realis_processed.csv"
+    pd.concat([pd.read_csv("tests/mock_data/mock_realis_processed.csv")] * 1000).to_csv(csv_file, index=False)
+    df = read_processed_table(csv_file)
+    df_default = pd.read_csv(csv_file)
+
+    bytes_per_row = df.memory_usage(deep=True).sum() / len(df)
+    default_bytes_per_row = df_default.memory_usage(deep=True).sum() / len(df_default)
+    print("bytes per row: {:.1f} with SCHEMA, {:.1f} with default dtypes".format(bytes_per_row, default_bytes_per_row))
+
+    assert df.dtypes.astype(str).to_dict() == SCHEMA
+    assert st_utils.SCHEMA == SCHEMA
+    assert bytes_per_row <= 64
+    assert bytes_per_row < default_bytes_per_row / 4
+
+def test_state_keeps_raw_column_order_of_reordered_exports(tmp_path):
+    df_raw = pd.read_csv("tests/mock_data/mock_realis.csv")
+    reordered = ['Address'] + [col for col in df_raw.columns if col != 'Address'][::-1]
+    df_raw[reordered].iloc[:40].to_csv(tmp_path / "realis.csv", index=False)
+    process_chunked(tmp_path / "realis.csv", tmp_path / "processed.csv", chunksize=10, n_partitions=4,
+                    state_dir=tmp_path / "state", columnar=tmp_path / "processed.cols")
+
+    # Two increments, so the second re-reads partitions the first appended to
+    ingest_state(tmp_path / "state", df_raw[reordered].iloc[40:50], tmp_path / "processed.cols")
+    ingest_state(tmp_path / "state", df_raw[reordered].iloc[50:], tmp_path / "processed.cols")
+    # A batch delivered again adds nothing and leaves the served artifact alone
+    manifest_mtime = os.stat(tmp_path / "processed.cols" / "manifest.json").st_mtime_ns
+    assert ingest_state(tmp_path / "state", df_raw[reordered].iloc[50:], tmp_path / "processed.cols") == 0
+    assert os.stat(tmp_path / "processed.cols" / "manifest.json").st_mtime_ns == manifest_mtime
+    for path in os.listdir(tmp_path / "state"):
+        if path.startswith("raw-"):
+            assert list(pd.read_csv(tmp_path / "state" / path).columns) == list(df_raw.columns) + ['project_address']
+
+    sort_cols = ['Project Name', 'Address', 'New Sale Datetime', 'Resale Datetime']
+    df_served = read_columnar(tmp_path / "processed.cols").sort_values(sort_cols, ignore_index=True)
+    df_full = process_table(df_raw).sort_values(sort_cols, ignore_index=True).astype(df_served.dtypes.to_dict())
+    pd.testing.assert_frame_equal(df_served, df_full, check_exact=False, rtol=1e-6)
+
+def test_pipeline_artifact_is_published_with_its_structures(tmp_path):
+    # Laid out as process_data writes it: the columnar artifact next to the processed CSV
+    process_chunked("tests/mock_data/mock_realis.csv", tmp_path / "realis_processed.csv", chunksize=10, n_partitions=4,
+                    state_dir=tmp_path / "state", columnar=tmp_path / "realis_processed.cols")
+    path = default_data_path(str(tmp_path / "realis_processed.csv"))
+    assert path == str(tmp_path / "realis_processed.cols") and read_derived(path) is None
+
+    # What the server's parent process does before starting workers, which then load from that path
+    assert publish_columnar(path) == path
+    assert read_derived(path) is not None
+    view = DatasetStore(path).load().current()
+    assert not view.index.area.order.flags.writeable and not view.performers.group_of_row.flags.writeable
+
+    # An increment swaps in an artifact with matching structures already inside
+    df_raw = pd.read_csv("tests/mock_data/mock_realis.csv")
+    df_extra = df_raw.iloc[:5].assign(**{'Project Name': 'NEW PROJECT'})
+    assert ingest_state(tmp_path / "state", df_extra, path) > 0
+    assert read_derived(path) is not None
+    assert "NEW PROJECT" in DatasetStore(path).load().current().search.search("new project")
@@ -0,0 +1,27 @@
+import threading
+import pytest
+from backend.src.utils import get_filtered_table, get_stats
+from backend.src.store import DatasetStore
+from backend.src.workers import WorkerPool, Overloaded, stats_task, performers_task
+
+store = DatasetStore("tests/mock_data/mock_realis_processed.csv").load()
+query = ("All","Condominium","All",200,2000,"2005")
+
+def test_queue_limit_rejects_fast():
+    workers = WorkerPool(max_workers=1, max_pending=2).start(store)
+    release = threading.Event()
+    blocked = [workers.submit(release.wait) for _ in range(2)]
+    with pytest.raises(Overloaded):
+        workers.submit(release.wait)
+    release.set()
+    assert all(future.result() for future in blocked)
+    assert workers.stats()["rejected"] == 1
+    workers.shutdown()
+
+def test_process_workers_preload_dataset():
+    workers = WorkerPool(max_workers=2, processes=True).start(store)
+    stats, rank_error = workers.submit(stats_task, store.version, query, "exact", 0).result()
+    assert stats == get_stats(get_filtered_table(*query, df=store.current().df)) and rank_error is None
+    df_top, _ = workers.submit(performers_task, store.version, query, 10).result()
+    assert len(df_top) > 0
+    workers.shutdown()
@@ -0,0 +1,23 @@
+from benchmarks.load_test import parse_mix, LoadRecorder, digest
+
+def test_parse_mix_normalizes_weights():
+    endpoints, weights = parse_mix("stats=3,report=1")
+    assert endpoints == ["stats", "report"] and weights == [0.75, 0.25]
+
+def test_recorder_percentiles_errors_and_chart_mismatches():
+    recorder = LoadRecorder({("chartprice", 0): digest(b"png")})
+    for i in range(100):
+        recorder.record("stats", 0, (i + 1) / 1000, 200 if i < 95 else 503, b"{}")
+    recorder.record("chartprice", 0, 0.01, 200, b"png")
+    recorder.record("chartprice", 0, 0.01, 200, b"other png")
+    summary = recorder.summary(elapsed=2.0)
+
+    assert summary["stats"]["requests"] == 100 and summary["stats"]["throughput_rps"] == 50
+    assert round(summary["stats"]["p50_ms"], 1) == 50.5 and summary["stats"]["p99_ms"] > 99
+    assert summary["stats"]["error_rate"] == 0.05 and summary["stats"]["statuses"]["503"] == 5
+    assert summary["chartprice"]["chart_mismatches"] == 1
+
+def test_recorder_without_reference_skips_chart_check():
+    recorder = LoadRecorder(None)
+    recorder.record("chartprice", 0, 0.01, 200, b"png")
+    assert "chart_mismatches" not in recorder.summary(elapsed=1.0)["chartprice"]
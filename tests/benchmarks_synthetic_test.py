@@ -0,0 +1,14 @@
+import pandas as pd
+from benchmarks.synthetic import generate_realis, write_realis
+from backend.src.utils import process_table, RAW_COLUMNS
+
+def test_generator_is_seeded_and_exact(tmp_path):
+    df = pd.concat(generate_realis(3000, seed=7, chunk_units=500))
+    assert len(df) == 3000
+    assert df.equals(pd.concat(generate_realis(3000, seed=7, chunk_units=500)))
+    assert not df.equals(pd.concat(generate_realis(3000, seed=8, chunk_units=500)))
+
+    assert write_realis(tmp_path / "realis.csv", 3000, seed=7) == 3000
+    df_processed = process_table(pd.read_csv(tmp_path / "realis.csv", usecols=RAW_COLUMNS))
+    assert len(df_processed) > 1000
+    assert (df_processed['Property Age (Years)'] > 0).all()